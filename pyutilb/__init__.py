@@ -1,18 +1,40 @@
-from . import util
-from . import template
-from . import cmd
-from . import log
-from . import lazy
-from . import ocr_youdao
-from . import ocr_baidu
-from .yaml_boot import YamlBoot, BreakException
-from .stat import Stat
-from .asyncio_threadpool import EventLoopThread, EventLoopThreadPool
-from .asyncio_apscheduler_thread import SchedulerThread
-from .atomic import AtomicInteger, AtomicStarter
-from .base_validator import BaseValidator
-from .base_extractor import BaseExtractor
-from .spark_df_proxy import SparkDfProxy
+import importlib
+
+# 延迟加载: 第一次访问属性时才导入对应的模块, 以免导入pyutilb就加载pandas/requests/mako/apscheduler等较重的依赖
+# 属性名 => (模块名, 模块中的属性名), 属性名为None表示模块本身
+_lazy_attrs = {
+    "util": ("pyutilb.util", None),
+    "template": ("pyutilb.template", None),
+    "cmd": ("pyutilb.cmd", None),
+    "log": ("pyutilb.log", None),
+    "lazy": ("pyutilb.lazy", None),
+    "ocr_youdao": ("pyutilb.ocr_youdao", None),
+    "ocr_baidu": ("pyutilb.ocr_baidu", None),
+    "YamlBoot": ("pyutilb.yaml_boot", "YamlBoot"),
+    "BreakException": ("pyutilb.yaml_boot", "BreakException"),
+    "Stat": ("pyutilb.stat", "Stat"),
+    "EventLoopThread": ("pyutilb.asyncio_threadpool", "EventLoopThread"),
+    "EventLoopThreadPool": ("pyutilb.asyncio_threadpool", "EventLoopThreadPool"),
+    "SchedulerThread": ("pyutilb.asyncio_apscheduler_thread", "SchedulerThread"),
+    "AtomicInteger": ("pyutilb.atomic", "AtomicInteger"),
+    "AtomicStarter": ("pyutilb.atomic", "AtomicStarter"),
+    "BaseValidator": ("pyutilb.base_validator", "BaseValidator"),
+    "BaseExtractor": ("pyutilb.base_extractor", "BaseExtractor"),
+    "SparkDfProxy": ("pyutilb.spark_df_proxy", "SparkDfProxy"),
+}
+
+def __getattr__(name):
+    if name not in _lazy_attrs:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attr = _lazy_attrs[name]
+    val = importlib.import_module(module_name)
+    if attr is not None:
+        val = getattr(val, attr)
+    globals()[name] = val # 缓存, 下次不再调用 __getattr__()
+    return val
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attrs))
 
 __author__ = "shigebeyond"
 __version__ = "1.0.6"
@@ -50,6 +50,18 @@ class SchedulerThread(EventLoopThread):
         # 调整trigger
         return self.scheduler.reschedule_job(job_id, trigger='cron', **trigger_args)
 
+    # 作业的延迟: 已到期但还未执行的作业, 其下次执行时间距今的秒数
+    # :return 字典, key是作业id, value是延迟秒数, 未到期则为0
+    def job_lags(self):
+        now = datetime.datetime.now(self.scheduler.timezone)
+        lags = {}
+        for job in self.scheduler.get_jobs():
+            next_time = job.next_run_time
+            if next_time is None: # 暂停的作业
+                continue
+            lags[job.id] = max((now - next_time).total_seconds(), 0)
+        return lags
+
     # 解析cron表达式成trigger参数
     def parse_cron_expr(self, cron):
         cron = cron.strip()
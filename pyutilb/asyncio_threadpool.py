@@ -48,6 +48,16 @@ class EventLoopThread(object):
         self.loop.call_soon_threadsafe(self.loop.stop) # loop.stop()必须在call_soon_threadsafe()中调用(会发新的任务, 从而触发epoll信息), 否则无法会卡死在 EpollSelector.selectors.select()
         log.debug("%s: thread shutdown end", self.name)
 
+    # 队列深度: 事件循环中待执行的回调数
+    def queue_depth(self):
+        return len(self.loop._ready)
+
+    # 事件循环中未完成的任务数
+    def task_count(self):
+        if self.thread is None:
+            return 0
+        return len(asyncio.all_tasks(self.loop))
+
     # 添加任务(协程或回调函数), 返回future
     def exec(self, task, *args):
         # 1 递延创建与启动线程
@@ -15,7 +15,7 @@ class BaseExtractor(object):
         for var, path in fields.items():
             # 获得字段值
             if type == 'eval':
-                val = eval(path, globals(), get_vars()) # 丢失本地与全局变量, 如引用不了json模块
+                val = eval_expr(path, globals(), get_vars()) # 丢失本地与全局变量, 如引用不了json模块
             else:
                 val = self._get_val_by(type, path)
             # 抽取单个字段
@@ -4,18 +4,21 @@ import os
 import re
 import socket
 import sys
-import pandas as pd
-import requests
-import query_string
 import yaml
 from optparse import OptionParser
+from pyutilb.lazy import LazyModule
 from pyutilb.module_loader import load_module_funs
-from pyutilb.file import read_http_file, read_vars
+from pyutilb.file import read_http_file, read_vars, YamlLoader, use_http_cache
 from pyutilb.file import read_http_file
 from pyutilb.log import log
 from pyutilb.strs import substr_after_lines
 from pyutilb.util import set_vars, custom_funs, extend_list
 
+# 延迟导入较重的依赖, 减少命令行启动的耗时
+pd = LazyModule('pandas')
+requests = LazyModule('requests')
+query_string = LazyModule('query_string')
+
 # 解析命令的选项与参数
 # :param name 命令名
 # :param version 版本
@@ -43,6 +46,21 @@ def parse_cmd(name, version):
     optParser.add_option("-o", "--output", dest="output", type="string", help="Output directory for K8sBoot/SparkBoot generate file")
     # SparkBoot用到的参数
     optParser.add_option("-u", "--udf", dest="udf", type="string", help="Udf python file")
+    # 多进程分片执行
+    optParser.add_option("--workers", dest="workers", type="int", help="Run step files sharded across the specified number of processes")
+    # http响应的磁盘缓存
+    optParser.add_option("--http-cache", dest="http_cache", type="string", help="Directory to persist cached responses of remote files (step files, -D dataurl, read_yaml/read_json...), revalidated by ETag/Last-Modified")
+    # 持久化缓存步骤文件的解析结果
+    optParser.add_option("--step-cache", dest="step_cache", action="store_true", help="Cache parsed step files in the user cache directory (~/.cache/pyutilb/yamlcache, or $PYUTILB_CACHE_DIR/yamlcache), reused by later runs and sibling processes")
+    # 执行过程的跟踪
+    optParser.add_option("--trace", dest="trace", type="string", help="Write a Chrome Trace Event json file of the executed yaml files, steps and actions, eg: trace.json")
+    # 性能分析
+    optParser.add_option("--profile", dest="profile", type="string", help="Profile cpu with cProfile and write pstats file (with a text report in <file>.txt), eg: boot.pstats")
+    optParser.add_option("--tracemalloc", dest="tracemalloc", type="string", help="Trace memory allocations with tracemalloc and write the top allocations of each yaml file, eg: malloc.yml")
+    optParser.add_option("--profile-top", dest="profile_top", type="int", default=20, help="Number of entries in the profile reports")
+    # 运行时指标的导出
+    optParser.add_option("--metrics-port", dest="metrics_port", type="int", help="Expose runtime metrics in prometheus text format on the specified http port")
+    optParser.add_option("--metrics-host", dest="metrics_host", type="string", default="127.0.0.1", help="Address the metrics http server listens on, default 127.0.0.1 (local only), use 0.0.0.0 to allow remote scraping")
 
     # 解析选项
     option, args = optParser.parse_args(args)
@@ -57,6 +75,33 @@ def parse_cmd(name, version):
         print(version)
         sys.exit(1)
 
+    # 应用选项: 设置变量+加载自定义函数
+    apply_cmd_option(option)
+
+    # 记录选项
+    global cmd_option
+    cmd_option = option
+
+    # print(option)
+    # print(args)
+    return args, option
+
+# parse_cmd()解析出的命令选项
+cmd_option = None
+
+# 获得parse_cmd()解析出的单个命令选项
+def get_cmd_option(name, default = None):
+    if cmd_option is None:
+        return default
+    return getattr(cmd_option, name, default)
+
+# 应用命令选项: 设置变量+加载自定义函数
+# 也用在多进程执行时, 子进程根据父进程的命令选项来初始化自己的变量与自定义函数
+def apply_cmd_option(option):
+    # 指定http响应的磁盘缓存目录, 要在读 dataurl 之前设置
+    if getattr(option, 'http_cache', None):
+        use_http_cache(True, option.http_cache)
+
     # 指定变量: 直接指定
     if option.data != None:
         data = query_string.parse(option.data)
@@ -73,10 +118,6 @@ def parse_cmd(name, version):
         funs = load_module_funs(option.funs)
         custom_funs.update(funs)
 
-    # print(option)
-    # print(args)
-    return args, option
-
 # 抓取pypi.org上指定项目的版本
 def fetch_pypi_project_version(project):
     html = read_http_file(f"https://pypi.org/project/{project}")
@@ -93,7 +134,7 @@ def run_command(cmd):
 # 同步执行命令，并将输出转为yaml对象
 def run_command_return_yaml(cmd):
     output = run_command(cmd)
-    return yaml.load(output, Loader=yaml.FullLoader)
+    return yaml.load(output, Loader=YamlLoader)
 
 # 同步执行命令，并将输出整理为df
 def run_command_return_dataframe(cmd, fix_output = None):
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import bz2
+import gzip
+import lzma
+import re
+
+'''
+透明解压: 根据文件头的魔数来识别 gz/bz2/xz 压缩文件, 读文件时流式解压, 不用解压到临时文件
+'''
+
+# 压缩格式 => (魔数的正则, 模块)
+compressions = {
+    'gzip': (re.compile(re.escape(b'\x1f\x8b')), gzip),
+    # bz2的魔数 BZh 是可打印字符, 要连同块大小(1-9)与首块的魔数(空文件则是流结束的魔数)一起匹配, 以免将 BZh 开头的文本文件误认为压缩文件
+    'bz2': (re.compile(re.escape(b'BZh') + b'[1-9](' + re.escape(b'1AY&SY') + b'|' + re.escape(b'\x17rE8P\x90') + b')'), bz2),
+    'xz': (re.compile(re.escape(b'\xfd7zXZ\x00')), lzma),
+}
+
+# 魔数的最大长度
+magic_size = 10
+
+# 根据文件头的魔数识别压缩格式
+# :param head 文件头的字节
+# :return 压缩格式, 即 gzip/bz2/xz, 非压缩文件则返回None
+def detect_compression_by_magic(head):
+    for compression, (magic, _) in compressions.items():
+        if magic.match(head):
+            return compression
+    return None
+
+# 识别本地文件的压缩格式: 以文件头的魔数为准, 以免扩展名与内容不符(如未压缩的.gz文件)
+# :return 压缩格式, 非压缩文件则返回None
+def detect_compression(path):
+    with open(path, 'rb') as f:
+        return detect_compression_by_magic(f.read(magic_size))
+
+# 打开本地文件来读, 压缩文件则边读边解压
+# :param path 文件路径
+# :param mode 模式, r或rb
+# :param encoding 文本的编码
+# :return 文件对象
+def open_file(path, mode = 'r', encoding = 'utf-8'):
+    compression = detect_compression(path)
+    binary = 'b' in mode
+    if compression is None:
+        if binary:
+            return open(path, 'rb')
+        return open(path, 'r', encoding=encoding)
+    module = compressions[compression][1]
+    if binary:
+        return module.open(path, 'rb')
+    return module.open(path, 'rt', encoding=encoding)
+
+# 如果数据是压缩的, 则解压, 用于http文件等已读到内存中的数据
+# :param data 字节
+# :return 解压后的字节, 非压缩数据则原样返回
+def decompress_bytes(data):
+    compression = detect_compression_by_magic(data[:magic_size])
+    if compression is None:
+        return data
+    return compressions[compression][1].decompress(data)
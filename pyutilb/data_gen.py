@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import re
+import numpy as np
+import pandas as pd
+from pyutilb.util import *
+
+'''
+批量生成测试数据
+    根据列的表达式配置, 一次性生成n行数据, 输出为 pd.DataFrame 或分块的迭代器
+    列表达式同变量表达式中的函数调用, 如 {uid: incr, name: random_str(8), code: random_int(6)}
+    其中 incr/random_str/random_int/random_element/now/hostname 用numpy向量化生成, 其他函数则逐行调用
+'''
+class DataGenerator(object):
+
+    def __init__(self, spec: dict, seed = None):
+        '''
+        构造函数
+        :param spec: 列的表达式配置, key是列名, value是列表达式
+        :param seed: 随机种子, 用于生成可重现的数据
+        '''
+        self.rng = np.random.default_rng(seed)
+        self.columns = [(name, self.compile_column(name, expr)) for name, expr in spec.items()]
+
+    # 编译单列的表达式, 返回生成n行值的函数
+    def compile_column(self, name, expr):
+        # 非字符串: 常量
+        if not isinstance(expr, str):
+            return lambda n: np.full(n, expr, dtype=object)
+
+        # 去掉 ${} 包装
+        mat = re.match(r'\$\{(.+)\}$', expr)
+        if mat:
+            expr = mat.group(1)
+
+        # 解析函数与参数
+        try:
+            func, params = parse_func(expr, True)
+        except Exception:
+            func, params = None, []
+
+        # 1 向量化的系统函数
+        if func == 'incr':
+            key = params[0] if params else name # 无参数则用列名作为自增的键
+            return lambda n: self.gen_incr(key, n)
+        if func == 'random_str':
+            return lambda n: self.gen_random_str(base_str, int(params[0]), n)
+        if func == 'random_int':
+            return lambda n: self.gen_random_str(digit_str, int(params[0]), n)
+        if func == 'random_element':
+            return lambda n: self.gen_random_element(params[0], n)
+        if func in ('now', 'hostname'):
+            if func == 'now' and not params: # 系统函数 now(_) 要1个占位参数
+                params = [None]
+            return lambda n: np.full(n, call_func(func, params), dtype=object)
+
+        # 2 其他函数: 逐行调用
+        if func in sys_funcs or func in custom_funs:
+            return lambda n: np.array([call_func(func, params) for _ in range(n)], dtype=object)
+
+        # 3 带变量的表达式: 逐行替换
+        if '$' in expr:
+            return lambda n: np.array([replace_var(expr, False) for _ in range(n)], dtype=object)
+
+        # 4 常量
+        return lambda n: np.full(n, expr, dtype=object)
+
+    # 生成n个自增值: 一次性占用n个值, 线程安全
+    def gen_incr(self, key, n):
+        end = get_incr_counter(key).inc(n)
+        return np.arange(end - n + 1, end + 1)
+
+    # 生成n个指定长度的随机字符串
+    def gen_random_str(self, chars, length, n):
+        chars = np.frombuffer(chars.encode(), dtype='S1')
+        idx = self.rng.integers(0, len(chars), size=(n, length))
+        return chars[idx].view(f'S{length}').reshape(n).astype(str)
+
+    # 从list变量中随机挑选n个元素
+    def gen_random_element(self, var, n):
+        items = get_var(var)
+        if not isinstance(items, (list, tuple, set, range)):
+            raise Exception('Param in random_element(param) must be list/tuple/set/range/range type')
+        items = list(items)
+        idx = self.rng.integers(0, len(items), size=n)
+        return np.array(items, dtype=object)[idx]
+
+    # 生成n行数据
+    def generate(self, n) -> pd.DataFrame:
+        n = int(n)
+        return pd.DataFrame({name: gen(n) for name, gen in self.columns})
+
+    # 分块生成n行数据
+    # :param n 总行数
+    # :param chunksize 每块的行数
+    def iter_chunks(self, n, chunksize = 100000):
+        n = int(n)
+        for start in range(0, n, chunksize):
+            yield self.generate(min(chunksize, n - start))
+
+# 根据列的表达式配置, 生成n行数据
+def gen_dataframe(spec: dict, n, seed = None) -> pd.DataFrame:
+    return DataGenerator(spec, seed).generate(n)
+
+# 根据列的表达式配置, 分块生成n行数据
+def iter_dataframes(spec: dict, n, chunksize = 100000, seed = None):
+    return DataGenerator(spec, seed).iter_chunks(n, chunksize)
+
+if __name__ == '__main__':
+    spec = {'uid': 'incr', 'name': 'random_str(8)', 'code': 'random_int(6)', 'type': 'user'}
+    print(gen_dataframe(spec, 5))
+    for df in iter_dataframes(spec, 5, 2):
+        print(df)
@@ -1,12 +1,35 @@
+import atexit
+import binascii
+import copy
+import glob
+import hashlib
+import importlib.util
 import json
+import mmap
 import os
+import pickle
 import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from io import StringIO
-import pandas as pd
-import requests
 import yaml
-from dotenv import dotenv_values
-from jsonpath import jsonpath
+from pyutilb.lazy import LazyModule
+from pyutilb.log import log
+from pyutilb.http_cache import http_session, http_cache, use_http_cache, check_http_file_response, response_text
+from pyutilb.compression import open_file, detect_compression
+
+# 延迟导入较重的依赖, 减少导入pyutilb的耗时
+pd = LazyModule('pandas')
+requests = LazyModule('requests')
+
+# yaml加载器: 有libyaml则用C实现的加载器, 解析速度快好几倍
+YamlLoader = yaml.CFullLoader if getattr(yaml, '__with_libyaml__', False) else yaml.FullLoader
+
+# 延迟导入的jsonpath
+def jsonpath(obj, expr, *args, **kwargs):
+    from jsonpath import jsonpath as do_jsonpath
+    return do_jsonpath(obj, expr, *args, **kwargs)
 
 # 文件大小单位,相邻单位相差1024倍
 file_size_units = "BKMGT";
@@ -41,48 +64,151 @@ def bytes2file_size(bytes, unit, print_unit = True):
 
 # -------------------- 读写文件 ----------------------
 # 写文本文件
-def write_file(path, content, append = False):
+# :param append 是否追加写; 频繁追加小块内容时请改用 append_file(), 不用每次都打开关闭文件
+# :param atomic 是否原子写(仅对非追加写有效): 先写临时文件再改名, 读文件的一方不会读到写了一半的文件
+def write_file(path, content, append = False, atomic = False):
     if append:
         mode = 'a'
     else:
         mode = 'w'
+        if atomic:
+            write_file_atomic(path, content, mode)
+            return
     with open(path, mode, encoding="utf-8") as file:
         file.write(content)
 
-# 读文本文件
+# 读文本文件, 支持 gz/bz2/xz 压缩文件(根据文件头识别), 边读边解压
 def read_file(path):
-    with open(path, 'r', encoding="utf-8") as file:
+    with open_file(path, 'r', encoding="utf-8") as file:
         return file.read()
 
 # 写二进制文件
-def write_byte_file(path, content, append = False):
+# :param append 是否追加写; 频繁追加小块内容时请改用 append_byte_file()
+# :param atomic 是否原子写(仅对非追加写有效)
+def write_byte_file(path, content, append = False, atomic = False):
     if append:
         mode = 'ab'
     else:
         mode = 'wb'
+        if atomic:
+            write_file_atomic(path, content, mode)
+            return
     with open(path, mode) as file:
         file.write(content)
 
+# 原子写文件: 先写同目录下的临时文件再改名, 改名是原子的, 因此读文件的一方要么读到旧文件, 要么读到完整的新文件
+# 如果该文件有池化的追加写器, 会先关闭它, 以免其后续写入的是被替换掉的旧文件
+def write_file_atomic(path, content, mode = 'w'):
+    file_appenders.close(path)
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_file, mode, encoding=None if 'b' in mode else "utf-8") as file:
+            file.write(content)
+        os.replace(tmp_file, path)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
 # 读二进制文件
 def read_byte_file(path):
     with open(path, 'rb') as file:
         return file.read()
 
 # 读http文件内容
+# 用共享的Session来复用连接, 并有响应缓存: 在 Cache-Control: max-age 有效期内直接用缓存, 过期后发条件请求, 服务端返回304则用缓存
 def read_http_file(url):
-    res = requests.get(url)
-    if res.status_code == 404:
-        raise Exception(f"Remote file not exist: {url}")
-    if res.status_code != 200:
-        raise Exception(f"Fail to read remote file: {url} ")
-    # return res.content.decode("utf-8")
-    return res.text
+    return http_cache.read(url)
+
+# 条件读http文件内容: 带上次响应的 ETag/Last-Modified, 文件未修改时服务端返回304
+# :return 元组(文件内容, ETag, Last-Modified), 如果文件未修改则文件内容为None
+def read_http_file_if_modified(url, etag = None, last_modified = None):
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    res = http_session().get(url, headers=headers)
+    if res.status_code == 304: # 未修改
+        return None, etag, last_modified
+    check_http_file_response(url, res)
+    return response_text(res), res.headers.get('ETag'), res.headers.get('Last-Modified')
+
+# 解析yaml
+def parse_yaml(txt):
+    return yaml.load(txt, Loader=YamlLoader)
 
 # 读yaml文件
 # :param yaml_file yaml文件，支持本地文件与http文件
 def read_yaml(yaml_file):
     txt = read_local_or_http_file(yaml_file)
-    return yaml.load(txt, Loader=yaml.FullLoader)
+    return parse_yaml(txt)
+
+# 持久化的yaml解析结果缓存的目录名: 位于当前用户的缓存目录下
+yaml_cache_dir = 'yamlcache'
+
+# 获得当前用户私有的缓存目录: 可用环境变量 PYUTILB_CACHE_DIR 指定根目录, 默认为 $XDG_CACHE_HOME/pyutilb 或 ~/.cache/pyutilb
+# :param name 子目录名
+def get_user_cache_dir(name):
+    root = os.environ.get('PYUTILB_CACHE_DIR') or os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'pyutilb')
+    dir = os.path.join(root, name)
+    os.makedirs(dir, mode=0o700, exist_ok=True)
+    return dir
+
+# 检查缓存文件是否可信: 文件及其目录都属于当前用户, 且其他用户不可写
+# 用于加载pickle缓存之前, 以免加载别人放进来的pickle文件而执行任意代码
+def is_trusted_cache_file(path):
+    if not hasattr(os, 'getuid'): # windows: 用户的缓存目录本身就是私有的
+        return True
+    uid = os.getuid()
+    for p in (path, os.path.dirname(path)):
+        stat = os.stat(p)
+        if stat.st_uid != uid or stat.st_mode & 0o022:
+            return False
+    return True
+
+# 读yaml文件, 解析结果会持久化缓存到当前用户的缓存目录(见 get_user_cache_dir())中, 供后续运行或其他进程(如locust的worker)复用
+# 需显式启用: 只有调用 YamlBoot.use_persist_cache(True) 或指定命令行选项 --step-cache 时, 步骤文件才会走该函数
+# 缓存以 文件绝对路径+mtime+size 为key, 文件修改后自动失效; 缓存文件不属于当前用户或其他用户可写则不加载; 目录不可写则不缓存
+# :param yaml_file yaml文件，支持本地文件与http文件, 其中http文件不做持久化缓存
+def read_yaml_persist_cached(yaml_file):
+    if is_http_file(yaml_file):
+        return read_yaml(yaml_file)
+
+    yaml_file = os.path.abspath(yaml_file)
+    stat = os.stat(yaml_file)
+    key = (yaml_file, stat.st_mtime_ns, stat.st_size)
+    # 文件名带上路径的摘要, 以区分不同目录下的同名文件
+    name = os.path.basename(yaml_file)
+    digest = hashlib.sha1(yaml_file.encode('utf-8')).hexdigest()[:16]
+    try:
+        cache_file = os.path.join(get_user_cache_dir(yaml_cache_dir), f"{name}.{digest}.pickle")
+    except Exception as ex: # 如无法创建缓存目录
+        log.debug("Fail to create yaml cache directory: %s", ex)
+        return read_yaml(yaml_file)
+
+    # 1 读缓存
+    try:
+        if is_trusted_cache_file(cache_file):
+            with open(cache_file, 'rb') as f:
+                cached_key, data = pickle.load(f)
+            if cached_key == key:
+                return data
+        else:
+            log.warning("Ignore untrusted yaml cache file: %s", cache_file)
+    except Exception: # 缓存不存在或已损坏
+        pass
+
+    # 2 解析并写缓存: 先写临时文件再改名, 防止多个进程同时写
+    data = read_yaml(yaml_file)
+    try:
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb', opener=lambda path, flags: os.open(path, flags, 0o600)) as f: # 只有当前用户可读写
+            pickle.dump((key, data), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except Exception as ex: # 如目录不可写
+        log.debug("Fail to write yaml cache file %s: %s", cache_file, ex)
+    return data
 
 # 读json文件
 # :param json_file json文件，支持本地文件与http文件
@@ -90,12 +216,17 @@ def read_json(json_file):
     txt = read_local_or_http_file(json_file)
     return json.loads(txt)
 
+# 解析.env
+def parse_env(txt):
+    from dotenv import dotenv_values
+    return dotenv_values(stream=StringIO(txt))
+
 # 读.env文件
 # :param env_file env文件，支持本地文件与http文件
 def read_env(env_file):
     #return dotenv_values(env_file) # 仅支持本地文件
     txt = read_local_or_http_file(env_file)
-    return dotenv_values(stream=StringIO(txt))
+    return parse_env(txt)
 
 # 读properties文件
 # :param properties_file properties文件，支持本地文件与http文件
@@ -103,17 +234,200 @@ def read_properties(properties_file):
     return read_env(properties_file)
 
 # 读csv文件
-# :param csv_file csv文件，支持本地文件与http文件
+# :param csv_file csv文件，支持本地文件与http文件, 支持 gz/bz2/xz 压缩文件
+# :param usecols 只读取的列名列表, 为None则读全部列
+# :param dtype 列类型, 如 {'uid': 'int64', 'name': 'string'}, 指定后不用再推断类型, 更快也更省内存
 # :return pd.DataFrame
-def read_csv(csv_file):
-    return pd.read_csv(csv_file)
+def read_csv(csv_file, usecols = None, dtype = None, **kwargs):
+    return pd.read_csv(csv_file, usecols=usecols, dtype=dtype, **csv_compression_kwargs(csv_file, kwargs))
+
+# 读csv文件的压缩参数: pandas只根据扩展名识别压缩格式, 本地文件则根据文件头识别 gz/bz2/xz
+# 识别不出的(如未压缩文件或.zip/.zst等)不覆盖, 仍由pandas根据扩展名推断
+def csv_compression_kwargs(csv_file, kwargs):
+    if 'compression' in kwargs or not isinstance(csv_file, str) or is_http_file(csv_file):
+        return kwargs
+    compression = detect_compression(csv_file)
+    if compression is None:
+        return kwargs
+    return dict(kwargs, compression=compression)
 
 # 读excel文件
 # :param excel_file excel文件，支持本地文件与http文件
 # :param sheet_name sheet名
+# :param usecols 只读取的列名列表, 为None则读全部列
+# :param dtype 列类型
+# :return pd.DataFrame
+def read_excel(excel_file, sheet_name, usecols = None, dtype = None, **kwargs):
+    return pd.read_excel(excel_file, sheet_name, usecols=usecols, dtype=dtype, **kwargs)
+
+# 分块读csv文件, 每次只有一块数据在内存中, 用于读大文件
+# :param csv_file csv文件，支持本地文件与http文件
+# :param chunksize 每块的行数
+# :param usecols 只读取的列名列表, 为None则读全部列
+# :param dtype 列类型
+# :return 生成器, 元素是 pd.DataFrame
+def iter_csv(csv_file, chunksize = 10000, usecols = None, dtype = None, **kwargs):
+    reader = pd.read_csv(csv_file, chunksize=int(chunksize), usecols=usecols, dtype=dtype, **csv_compression_kwargs(csv_file, kwargs))
+    try:
+        for chunk in reader:
+            yield chunk
+    finally:
+        reader.close()
+
+# 分块读excel文件
+#    本地的xlsx文件用 openpyxl 的只读模式逐行流式读取, 每次只有一块数据在内存中
+#    其他文件(如xls/http文件)则先整个读取再分块
+# :param excel_file excel文件，支持本地文件与http文件
+# :param sheet_name sheet名
+# :param chunksize 每块的行数
+# :param usecols 只读取的列名列表, 为None则读全部列
+# :param dtype 列类型
+# :return 生成器, 元素是 pd.DataFrame
+def iter_excel(excel_file, sheet_name, chunksize = 10000, usecols = None, dtype = None):
+    chunksize = int(chunksize)
+    if is_http_file(excel_file) or not excel_file.endswith(('.xlsx', '.xlsm')):
+        df = read_excel(excel_file, sheet_name, usecols=usecols, dtype=dtype)
+        for i in range(0, len(df), chunksize):
+            yield df.iloc[i:i + chunksize]
+        return
+
+    import openpyxl
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        # 要读取的列的序号
+        idxes = range(len(header)) if usecols is None else [header.index(col) for col in usecols]
+        columns = [header[i] for i in idxes]
+        start = 0
+        buf = []
+        for row in rows:
+            buf.append([row[i] for i in idxes])
+            if len(buf) >= chunksize:
+                yield build_chunk(buf, columns, dtype, start)
+                start += len(buf)
+                buf = []
+        if buf:
+            yield build_chunk(buf, columns, dtype, start)
+    finally:
+        wb.close()
+
+# 构建分块的DataFrame, 行号接着上一块
+def build_chunk(rows, columns, dtype, start):
+    df = pd.DataFrame(rows, columns=columns, index=pd.RangeIndex(start, start + len(rows)))
+    if dtype is not None:
+        df = df.astype(dtype)
+    return df
+
+# 逐行读csv文件: 内部分块读取, 每次只有一块数据在内存中, 可用于for循环
+# :param csv_file csv文件，支持本地文件与http文件
+# :param chunksize 每块的行数
+# :param usecols 只读取的列名列表, 为None则读全部列
+# :param dtype 列类型
+# :return 生成器, 元素是dict, key为列名
+def iter_csv_rows(csv_file, chunksize = 10000, usecols = None, dtype = None, **kwargs):
+    for chunk in iter_csv(csv_file, chunksize, usecols, dtype, **kwargs):
+        yield from iter_df_rows(chunk)
+
+# 逐行迭代DataFrame, 比按下标取行快得多
+# :return 生成器, 元素是dict, key为列名
+def iter_df_rows(df):
+    columns = list(df.columns)
+    for row in df.itertuples(index=False, name=None):
+        yield dict(zip(columns, row))
+
+# 逐行读json lines文件(每行一个json), 可用于for循环
+# :param jsonl_file json lines文件，支持本地文件与http文件, 其中http文件是流式读取的
+# :return 生成器, 元素是每行解析后的json
+def iter_jsonl(jsonl_file):
+    if is_http_file(jsonl_file):
+        with http_session().get(jsonl_file, stream=True) as res:
+            check_http_file_response(jsonl_file, res)
+            for line in res.iter_lines(decode_unicode=True):
+                if line and not line.isspace():
+                    yield json.loads(line)
+        return
+
+    with open_file(jsonl_file, 'r', encoding="utf-8") as f:
+        for line in f:
+            if line and not line.isspace():
+                yield json.loads(line)
+
+# 表格文件(csv/excel)解析结果的列式缓存的目录名: 位于文件所在目录下, 类似 __pycache__
+data_cache_dir = '__datacache__'
+
+# 有列式缓存的读csv文件: 解析结果会持久化缓存到旁边的 __datacache__ 目录中, 后续加载时不用再解析csv
+# 有pyarrow时缓存为feather文件, 并用内存映射来加载, 否则缓存为pickle文件
+# 缓存以 文件绝对路径+mtime+size+读取参数 为key, 文件修改后自动失效; 目录不可写则不缓存
+# :param csv_file csv文件，支持本地文件与http文件, 其中http文件不做缓存
+# :param usecols 只读取的列名列表, 为None则读全部列
+# :param dtype 列类型
+# :return pd.DataFrame
+def read_csv_data_cached(csv_file, usecols = None, dtype = None):
+    return read_data_cached(csv_file, read_csv, usecols=usecols, dtype=dtype)
+
+# 有列式缓存的读excel文件
+# :param excel_file excel文件，支持本地文件与http文件, 其中http文件不做缓存
+# :param sheet_name sheet名
+# :param usecols 只读取的列名列表, 为None则读全部列
+# :param dtype 列类型
 # :return pd.DataFrame
-def read_excel(excel_file, sheet_name):
-    return pd.read_excel(excel_file, sheet_name)
+def read_excel_data_cached(excel_file, sheet_name, usecols = None, dtype = None):
+    return read_data_cached(excel_file, read_excel, sheet_name, usecols=usecols, dtype=dtype)
+
+# 有列式缓存的读表格文件
+# :param file 本地文件或http文件
+# :param load 加载函数, 返回 pd.DataFrame
+# :param args/kwargs 加载函数的其他参数, 也是缓存key的一部分
+def read_data_cached(file, load, *args, **kwargs):
+    if is_http_file(file):
+        return load(file, *args, **kwargs)
+
+    file = os.path.abspath(file)
+    stat = os.stat(file)
+    key = repr((file, stat.st_mtime_ns, stat.st_size, load.__name__, args, sorted(kwargs.items())))
+    feather = has_pyarrow()
+    dir, name = os.path.split(file)
+    # 文件名带上key的摘要, 不同的读取参数对应不同的缓存文件
+    prefix = os.path.join(dir, data_cache_dir, name + '.')
+    cache_file = prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + ('.feather' if feather else '.pickle')
+
+    # 1 读缓存
+    if os.path.exists(cache_file):
+        try:
+            if feather:
+                from pyarrow import feather as pa_feather
+                return pa_feather.read_table(cache_file, memory_map=True).to_pandas()
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception as ex: # 缓存已损坏
+            log.debug("Fail to read data cache file %s: %s", cache_file, ex)
+
+    # 2 解析并写缓存: 先写临时文件再改名, 防止多个进程同时写
+    df = load(file, *args, **kwargs)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if feather:
+            df.reset_index(drop=True).to_feather(tmp_file)
+        else:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(df, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        # 删除该文件的过期缓存: 即在文件修改之前写的缓存
+        for old_file in glob.glob(glob.escape(prefix) + '*'):
+            if not old_file.endswith('.tmp') and os.stat(old_file).st_mtime_ns < stat.st_mtime_ns:
+                os.remove(old_file)
+    except Exception as ex: # 如目录不可写, 或列类型不支持feather
+        log.debug("Fail to write data cache file %s: %s", cache_file, ex)
+    return df
+
+# 是否安装了pyarrow
+@lru_cache(maxsize=None)
+def has_pyarrow():
+    return importlib.util.find_spec('pyarrow') is not None
 
 # 是否是http文件
 def is_http_file(file):
@@ -143,7 +457,389 @@ def read_vars(url):
     txt = read_http_file(url)
     if txt[0] == '{':
         return json.loads(txt)
-    return yaml.load(txt, Loader=yaml.FullLoader)
+    return yaml.load(txt, Loader=YamlLoader)
+
+# -------------------- 大文件的读取/摘要/编码 ----------------------
+# 超过该字节数的文件才用mmap读
+mmap_min_size = 1024 * 1024
+# 分块读文件的块大小, 是3的倍数, 以便分块做base64编码
+file_chunk_size = 3 * 256 * 1024
+
+# 用mmap读二进制文件, 返回只读的memoryview, 不用将整个文件复制到内存中; 对其切片也不会复制
+# 小文件则直接读取, 因为mmap的系统调用开销比复制还大
+# 注意: 在memoryview被释放之前, 映射的文件不能被截断
+# :param path 文件路径
+# :param min_size 超过该字节数的文件才用mmap读
+# :return memoryview
+def read_byte_file_mmap(path, min_size = mmap_min_size):
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < min_size or size == 0: # 空文件不能mmap
+            return memoryview(file.read())
+        mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm) # 关闭文件后, 映射依然有效
+
+# 分块读二进制文件, 复用同一个缓冲区
+# :return 生成器, 元素是缓冲区的memoryview, 下次迭代时会被覆盖, 调用方不要保留
+def iter_byte_file(path, chunk_size = file_chunk_size):
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, 'rb') as file:
+        while True:
+            # 读满整块, 除非到了文件末尾
+            n = 0
+            while n < chunk_size:
+                m = file.readinto(view[n:])
+                if not m:
+                    break
+                n += m
+            if n == 0:
+                break
+            yield view[:n]
+            if n < chunk_size:
+                break
+
+# 流式计算文件的摘要, 不用将整个文件读到内存中
+# :param path 文件路径
+# :param algorithm 摘要算法, 如 md5/sha1/sha256
+# :return 16进制的摘要
+def file_digest(path, algorithm = 'md5', chunk_size = file_chunk_size):
+    h = hashlib.new(algorithm)
+    for chunk in iter_byte_file(path, chunk_size):
+        h.update(chunk)
+    return h.hexdigest()
+
+# 文件的md5
+def file_md5(path):
+    return file_digest(path, 'md5')
+
+# 文件的sha256
+def file_sha256(path):
+    return file_digest(path, 'sha256')
+
+# 分块对文件做base64编码, 编码结果直接写到预分配的缓冲区中, 免得先读整个文件再编码时, 在内存中同时存在原文件与编码结果的多份拷贝
+# :param path 文件路径
+# :return base64编码的字符串
+def b64encode_file(path, chunk_size = file_chunk_size):
+    return b64encode_file_bytes(path, chunk_size).decode('ascii')
+
+# 分块对文件做base64编码
+# :return bytearray
+def b64encode_file_bytes(path, chunk_size = file_chunk_size):
+    chunk_size -= chunk_size % 3 # 每块必须是3的倍数, 否则中间块会有填充的=
+    size = os.path.getsize(path)
+    out = bytearray((size + 2) // 3 * 4)
+    pos = 0
+    for chunk in iter_byte_file(path, chunk_size):
+        encoded = binascii.b2a_base64(chunk, newline=False)
+        out[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    del out[pos:] # 读的过程中文件变小了
+    return out
+
+# 分块对文件做base64编码, 逐块返回, 用于流式上传
+# :return 生成器, 元素是base64编码的bytes
+def iter_b64encode_file(path, chunk_size = file_chunk_size):
+    chunk_size -= chunk_size % 3
+    for chunk in iter_byte_file(path, chunk_size):
+        yield binascii.b2a_base64(chunk, newline=False)
+
+# -------------------- 缓冲的追加写 ----------------------
+'''
+缓冲的追加写器: 文件句柄保持打开, 写入的内容先攒在缓冲中, 在缓冲满/定时/进程退出时才批量写文件
+    用于频繁追加小块内容的场景, 如记录结果的步骤/监控数据的输出, 省掉每次写都打开关闭文件的开销
+    注意: 未刷盘的内容对读文件的一方不可见, 可调用 flush() 来立即刷盘
+'''
+class FileAppender(object):
+
+    def __init__(self, path, binary = False, buffer_size = 64 * 1024):
+        '''
+        构造函数
+        :param path: 文件路径
+        :param binary: 是否写二进制
+        :param buffer_size: 缓冲大小(字符数或字节数), 缓冲满了就刷盘
+        '''
+        self.path = path
+        self.binary = binary
+        self.buffer_size = buffer_size
+        self.buf = []
+        self.buf_len = 0
+        self.file = open(path, 'ab') if binary else open(path, 'a', encoding="utf-8")
+        self._lock = threading.Lock()
+
+    # 写内容: 先写缓冲, 缓冲满了才刷盘
+    def write(self, content):
+        with self._lock:
+            if self.file is None:
+                raise Exception(f"File appender closed: {self.path}")
+            self.buf.append(content)
+            self.buf_len += len(content)
+            if self.buf_len >= self.buffer_size:
+                self._flush()
+
+    # 刷盘
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buf or self.file is None:
+            return
+        self.file.write((b'' if self.binary else '').join(self.buf))
+        self.file.flush()
+        self.buf.clear()
+        self.buf_len = 0
+
+    # 刷盘并关闭文件
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+'''
+追加写器的池: 按文件路径复用追加写器
+    后台线程定时将各追加写器刷盘, 进程退出时(atexit)刷盘并关闭全部追加写器
+'''
+class FileAppenderPool(object):
+
+    def __init__(self, flush_interval = 1, buffer_size = 64 * 1024):
+        '''
+        构造函数
+        :param flush_interval: 定时刷盘的间隔秒数
+        :param buffer_size: 每个追加写器的缓冲大小
+        '''
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.appenders = {} # 文件绝对路径 => 追加写器
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+    # 获得文件的追加写器, 没有则创建
+    def get(self, path, binary = False):
+        key = os.path.abspath(path)
+        appender = self.appenders.get(key)
+        if appender is None:
+            with self._lock:
+                appender = self.appenders.get(key)
+                if appender is None:
+                    appender = self.appenders[key] = FileAppender(path, binary, self.buffer_size)
+                    self._start_flusher()
+        if appender.binary != binary:
+            raise Exception(f"File appender of {path} is {'binary' if appender.binary else 'text'} mode")
+        return appender
+
+    # 递延启动定时刷盘的线程, 并注册退出时的关闭钩子
+    def _start_flusher(self):
+        if self._thread is not None:
+            return
+        atexit.register(self.close_all)
+        self._thread = threading.Thread(name='FileAppenderFlusher', target=self._run_flusher)
+        self._thread.daemon = True
+        self._thread.start()
+
+    # 定时刷盘
+    def _run_flusher(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush_all()
+
+    # 全部追加写器刷盘
+    def flush_all(self):
+        for appender in list(self.appenders.values()):
+            try:
+                appender.flush()
+            except Exception as ex:
+                log.error("Fail to flush file %s: %s", appender.path, ex)
+
+    # 关闭单个文件的追加写器
+    def close(self, path):
+        with self._lock:
+            appender = self.appenders.pop(os.path.abspath(path), None)
+        if appender is not None:
+            appender.close()
+
+    # 关闭全部追加写器
+    def close_all(self):
+        with self._lock:
+            appenders = list(self.appenders.values())
+            self.appenders.clear()
+        for appender in appenders:
+            try:
+                appender.close()
+            except Exception as ex:
+                log.error("Fail to close file %s: %s", appender.path, ex)
+
+# 追加写器的池
+file_appenders = FileAppenderPool()
+
+# fork出的子进程: 丢弃继承来的追加写器, 其缓冲中的内容由父进程刷盘, 以免子进程退出时重复写; 锁也可能在fork时正被持有, 要重建
+def _reset_appenders_after_fork():
+    file_appenders.appenders = {}
+    file_appenders._lock = threading.Lock()
+    file_appenders._closed = threading.Event()
+    file_appenders._thread = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_appenders_after_fork)
+
+# 缓冲的追加写文本文件: 复用打开的文件, 写入的内容在缓冲满/定时/进程退出时才刷盘
+def append_file(path, content):
+    file_appenders.get(path).write(content)
+
+# 缓冲的追加写二进制文件
+def append_byte_file(path, content):
+    file_appenders.get(path, True).write(content)
+
+# 将追加写的缓冲刷盘
+# :param path 文件路径, 为None则刷盘全部文件
+def flush_appended_files(path = None):
+    if path is None:
+        file_appenders.flush_all()
+        return
+    appender = file_appenders.appenders.get(os.path.abspath(path))
+    if appender is not None:
+        appender.flush()
+
+# -------------------- 文件读缓存 ----------------------
+'''
+文件解析结果的缓存, 按 (解析函数, 文件) 缓存, 有大小限制(LRU)
+    本地文件: 根据 mtime+size 来判断是否失效
+    http文件: 根据上次响应的 ETag/Last-Modified 来发条件请求, 服务端返回304则用缓存
+默认返回的是缓存的解析结果的副本, 调用方修改它不会影响缓存及其他调用方; 如果调用方保证不修改(如步骤文件的缓存), 可指定 copy=False 直接返回缓存的对象
+'''
+class FileCache(object):
+
+    def __init__(self, maxsize = 256, revalidate_http = True, copy = True):
+        self.maxsize = maxsize # 最多缓存的文件数
+        self.revalidate_http = revalidate_http # 是否对http文件发条件请求来判断是否失效, 否则http文件缓存后就不再请求
+        self.copy = copy # 是否返回解析结果的副本
+        self.enabled = True # 是否启用缓存
+        self.items = OrderedDict() # 缓存项: key为(解析函数名, 文件), value为(文件版本, 解析结果)
+        self._lock = threading.Lock()
+        # 统计
+        self.hits = 0
+        self.misses = 0
+
+    '''
+    读文件并解析, 有缓存
+    :param file 本地文件或http文件
+    :param parse 解析函数, 参数是文件内容
+    :param load 本地文件的加载函数, 参数是文件路径, 用于直接读文件路径的场景, 如pandas/mako
+    '''
+    def read(self, file, parse = None, load = None):
+        # 未启用缓存
+        if not self.enabled:
+            if load is not None and not is_http_file(file):
+                return load(file)
+            return parse(read_local_or_http_file(file))
+
+        func = load if load is not None else parse
+        key = (func.__module__, func.__qualname__, file)
+        with self._lock:
+            item = self.items.get(key)
+
+        if is_http_file(file):
+            if item is not None and not self.revalidate_http:
+                self.hits += 1
+            else:
+                item = self._read_http_file(file, parse, item)
+        else:
+            item = self._read_local_file(file, parse, load, item)
+
+        with self._lock:
+            self.items[key] = item
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        if self.copy:
+            return copy_data(item[1])
+        return item[1]
+
+    # 读本地文件: 根据 mtime+size 来判断是否失效
+    def _read_local_file(self, file, parse, load, item):
+        if not os.path.exists(file):
+            raise Exception(f"File not exist: {file}")
+        stat = os.stat(file)
+        version = (stat.st_mtime_ns, stat.st_size)
+        if item is not None and item[0] == version:
+            self.hits += 1
+            return item
+
+        self.misses += 1
+        if load is not None:
+            return version, load(file)
+        return version, parse(read_file(file))
+
+    # 读http文件: 条件请求
+    def _read_http_file(self, url, parse, item):
+        etag = last_modified = None
+        if item is not None:
+            etag, last_modified = item[0]
+        txt, etag2, last_modified2 = read_http_file_if_modified(url, etag, last_modified)
+        if txt is None: # 未修改
+            self.hits += 1
+            return item
+
+        self.misses += 1
+        return (etag2, last_modified2), parse(txt)
+
+    # 清空缓存
+    def clear(self):
+        with self._lock:
+            self.items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    # 统计
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.items),
+        }
+
+# 复制解析结果: dict/list深复制, DataFrame调用其copy(), 其他(如字符串)不可变则原样返回
+def copy_data(data):
+    if isinstance(data, (dict, list)):
+        return copy.deepcopy(data)
+    if hasattr(data, 'copy'):
+        return data.copy()
+    return data
+
+# 文件读缓存, 用于 util.sys_funcs 中的读文件函数
+file_cache = FileCache()
+
+# 设置是否启用文件读缓存
+def use_file_cache(enabled):
+    file_cache.enabled = enabled
+    if not enabled:
+        file_cache.clear()
+
+# 有缓存的读yaml文件
+def read_yaml_cached(yaml_file):
+    return file_cache.read(yaml_file, parse_yaml)
+
+# 有缓存的读json文件
+def read_json_cached(json_file):
+    return file_cache.read(json_file, json.loads)
+
+# 有缓存的读.env文件
+def read_env_cached(env_file):
+    return file_cache.read(env_file, parse_env)
+
+# 有缓存的读properties文件
+def read_properties_cached(properties_file):
+    return read_env_cached(properties_file)
+
+# 有缓存的读csv文件
+def read_csv_cached(csv_file):
+    return file_cache.read(csv_file, parse_csv, read_csv)
+
+# 解析csv
+def parse_csv(txt):
+    return pd.read_csv(StringIO(txt))
 
 if __name__ == '__main__':
     rows = read_csv('/home/shi/tk.csv')
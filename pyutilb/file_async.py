@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pyutilb import file
+from pyutilb.file import is_http_file, parse_yaml, parse_env
+
+'''
+异步读写文件: 与 file.py 中的同名函数(去掉_async后缀)一一对应, 供事件循环中的协程(如 EventLoopThread/Tail 的回调)使用, 以免阻塞事件循环
+    1. 本地文件: 在专用的文件io线程池中读写, 不占用事件循环的默认线程池
+    2. http文件: 在专用的http线程池中读, 复用 file.read_http_file() 的连接池与响应缓存; 与本地文件分开, 防止慢的http请求占满线程导致本地文件读写排队
+    3. 批量读: read_files_async() 并发读多个文件, 并限制并发数
+    同步api保持不变
+'''
+
+# 文件io线程池的线程数
+file_io_workers = 8
+# http线程池的线程数
+http_io_workers = 16
+
+_executors = {} # 名称 => 线程池
+_executors_lock = threading.Lock()
+
+# 获得线程池: 递延创建
+def get_executor(name):
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                workers = file_io_workers if name == 'FileIO' else http_io_workers
+                executor = _executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+    return executor
+
+# 设置线程池的线程数, 会关闭已创建的线程池(已提交的任务会继续执行完)
+# :param file_workers 文件io线程池的线程数
+# :param http_workers http线程池的线程数
+def set_io_workers(file_workers = None, http_workers = None):
+    global file_io_workers, http_io_workers
+    with _executors_lock:
+        if file_workers is not None:
+            file_io_workers = int(file_workers)
+        if http_workers is not None:
+            http_io_workers = int(http_workers)
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False)
+
+# fork出的子进程中没有父进程的线程池的线程, 要丢弃继承来的线程池, 在子进程中重建
+def _reset_executors_after_fork():
+    global _executors_lock
+    _executors.clear()
+    _executors_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executors_after_fork)
+
+# 在文件io线程池中执行函数
+async def run_in_file_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor('FileIO'), partial(func, *args, **kwargs))
+
+# 在http线程池中执行函数
+async def run_in_http_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor('HttpIO'), partial(func, *args, **kwargs))
+
+# -------------------- 读写文件 ----------------------
+# 写文本文件
+async def write_file_async(path, content, append = False, atomic = False):
+    return await run_in_file_executor(file.write_file, path, content, append, atomic)
+
+# 读文本文件
+async def read_file_async(path):
+    return await run_in_file_executor(file.read_file, path)
+
+# 写二进制文件
+async def write_byte_file_async(path, content, append = False, atomic = False):
+    return await run_in_file_executor(file.write_byte_file, path, content, append, atomic)
+
+# 读二进制文件
+async def read_byte_file_async(path):
+    return await run_in_file_executor(file.read_byte_file, path)
+
+# 读http文件内容
+async def read_http_file_async(url):
+    return await run_in_http_executor(file.read_http_file, url)
+
+# 本地文件或http文件
+async def read_local_or_http_file_async(path):
+    if is_http_file(path):
+        return await read_http_file_async(path)
+    return await run_in_file_executor(file.read_local_or_http_file, path)
+
+# 读yaml文件, 解析也在线程池中执行, 以免大文件的解析阻塞事件循环
+# :param yaml_file yaml文件，支持本地文件与http文件
+async def read_yaml_async(yaml_file):
+    if is_http_file(yaml_file):
+        txt = await read_http_file_async(yaml_file)
+        return await run_in_file_executor(parse_yaml, txt)
+    return await run_in_file_executor(file.read_yaml, yaml_file)
+
+# 读json文件
+# :param json_file json文件，支持本地文件与http文件
+async def read_json_async(json_file):
+    if is_http_file(json_file):
+        txt = await read_http_file_async(json_file)
+        return await run_in_file_executor(json.loads, txt)
+    return await run_in_file_executor(file.read_json, json_file)
+
+# 读.env文件
+# :param env_file env文件，支持本地文件与http文件
+async def read_env_async(env_file):
+    txt = await read_local_or_http_file_async(env_file)
+    return parse_env(txt)
+
+# 读properties文件
+# :param properties_file properties文件，支持本地文件与http文件
+async def read_properties_async(properties_file):
+    return await read_env_async(properties_file)
+
+# 读csv文件
+# :param csv_file csv文件，支持本地文件与http文件
+# :return pd.DataFrame
+async def read_csv_async(csv_file, usecols = None, dtype = None, **kwargs):
+    if is_http_file(csv_file):
+        return await run_in_http_executor(file.read_csv, csv_file, usecols, dtype, **kwargs)
+    return await run_in_file_executor(file.read_csv, csv_file, usecols, dtype, **kwargs)
+
+# 读excel文件
+# :param excel_file excel文件，支持本地文件与http文件
+# :param sheet_name sheet名
+# :return pd.DataFrame
+async def read_excel_async(excel_file, sheet_name, usecols = None, dtype = None, **kwargs):
+    if is_http_file(excel_file):
+        return await run_in_http_executor(file.read_excel, excel_file, sheet_name, usecols, dtype, **kwargs)
+    return await run_in_file_executor(file.read_excel, excel_file, sheet_name, usecols, dtype, **kwargs)
+
+# 读远端url返回的json/yaml形式的变量
+async def read_vars_async(url):
+    txt = await read_http_file_async(url)
+    if txt[0] == '{':
+        return json.loads(txt)
+    return await run_in_file_executor(parse_yaml, txt)
+
+# -------------------- 批量读 ----------------------
+# 并发执行多个协程, 并限制并发数
+# :param coros 协程的列表
+# :param concurrency 最大并发数
+# :param return_exceptions 是否将异常作为结果返回, 否则有一个异常就抛出
+# :return 结果的列表, 顺序与coros一致
+async def gather_limited(coros, concurrency = 16, return_exceptions = False):
+    sem = asyncio.Semaphore(int(concurrency))
+    async def run(coro):
+        async with sem:
+            return await coro
+    return await asyncio.gather(*[run(coro) for coro in coros], return_exceptions=return_exceptions)
+
+# 并发读多个文件
+# :param files 文件的列表, 支持本地文件与http文件
+# :param reader 读单个文件的异步函数, 如 read_yaml_async/read_json_async
+# :param concurrency 最大并发数
+# :param return_exceptions 是否将异常作为结果返回, 否则有一个文件读失败就抛出
+# :return 文件内容的列表, 顺序与files一致
+async def read_files_async(files, reader = read_local_or_http_file_async, concurrency = 16, return_exceptions = False):
+    return await gather_limited([reader(f) for f in files], concurrency, return_exceptions)
@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from pyutilb.compression import detect_compression_by_magic, decompress_bytes, magic_size
+from pyutilb.lazy import LazyModule
+from pyutilb.log import log
+
+# 延迟导入requests, 减少导入pyutilb的耗时
+requests = LazyModule('requests')
+
+'''
+http读文件的连接池与响应缓存
+    1. 共享的 requests.Session: 复用tcp/tls连接, 并限制每个host的最大连接数
+    2. 响应缓存: 按url缓存响应内容, 在 Cache-Control: max-age 有效期内直接用缓存, 过期后带上 ETag/Last-Modified 发条件请求, 服务端返回304则用缓存
+       缓存默认只在内存中, 指定目录后会持久化到磁盘, 供后续运行或其他进程复用
+'''
+
+# -------------------- 连接池 ----------------------
+# 每个host的最大连接数
+http_pool_maxsize = 10
+# 最多缓存连接池的host数
+http_pool_connections = 32
+
+_session = None
+_session_lock = threading.Lock()
+
+# 获得共享的Session
+def http_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_http_session()
+    return _session
+
+# 创建Session: 连接池满时阻塞等待, 以限制每个host的最大连接数
+def create_http_session():
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=http_pool_connections, pool_maxsize=http_pool_maxsize, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# 设置连接池大小, 会重建共享的Session
+# :param pool_maxsize 每个host的最大连接数
+# :param pool_connections 最多缓存连接池的host数
+def set_http_pool_size(pool_maxsize, pool_connections = None):
+    global _session, http_pool_maxsize, http_pool_connections
+    with _session_lock:
+        http_pool_maxsize = int(pool_maxsize)
+        if pool_connections is not None:
+            http_pool_connections = int(pool_connections)
+        old, _session = _session, None
+    if old is not None:
+        old.close()
+
+# 检查http文件的响应
+def check_http_file_response(url, res):
+    if res.status_code == 404:
+        raise Exception(f"Remote file not exist: {url}")
+    if res.status_code != 200:
+        raise Exception(f"Fail to read remote file: {url} ")
+
+# 响应的文本: 如果响应的是压缩文件(如.gz文件, 而不是http层的Content-Encoding压缩), 则解压
+def response_text(res):
+    data = res.content
+    if detect_compression_by_magic(data[:magic_size]) is None:
+        return res.text
+    return decompress_bytes(data).decode('utf-8')
+
+# -------------------- 响应缓存 ----------------------
+'''
+http响应缓存, 按url缓存, 有大小限制(LRU)
+    缓存项是dict: url/etag/last_modified/expires(过期时间戳)/text
+'''
+class HttpCache(object):
+
+    def __init__(self, dir = None, maxsize = 256):
+        '''
+        构造函数
+        :param dir: 磁盘缓存的目录, 为None则只缓存在内存中
+        :param maxsize: 内存中最多缓存的url数
+        '''
+        self.dir = dir
+        self.maxsize = maxsize
+        self.enabled = True # 是否启用缓存
+        self.items = OrderedDict() # url => 缓存项
+        self._lock = threading.Lock()
+        # 统计
+        self.hits = 0 # 未过期, 直接用缓存
+        self.revalidations = 0 # 过期, 但服务端返回304
+        self.misses = 0
+
+    # 读http文件内容
+    def read(self, url):
+        if not self.enabled:
+            res = http_session().get(url)
+            check_http_file_response(url, res)
+            return response_text(res)
+
+        now = time.time()
+        item = self.get_item(url)
+        # 1 未过期: 直接用缓存
+        if item is not None and item['expires'] > now:
+            self.hits += 1
+            return item['text']
+
+        # 2 条件请求
+        headers = {}
+        if item is not None:
+            if item['etag']:
+                headers['If-None-Match'] = item['etag']
+            if item['last_modified']:
+                headers['If-Modified-Since'] = item['last_modified']
+        res = http_session().get(url, headers=headers)
+
+        # 2.1 未修改: 用缓存, 并更新过期时间
+        if res.status_code == 304 and item is not None:
+            self.revalidations += 1
+            item = dict(item, expires=parse_expires(res, now))
+            self.put_item(url, item)
+            return item['text']
+
+        # 2.2 已修改
+        check_http_file_response(url, res)
+        self.misses += 1
+        text = response_text(res)
+        if 'no-store' not in res.headers.get('Cache-Control', ''):
+            item = {
+                'url': url,
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified'),
+                'expires': parse_expires(res, now),
+                'text': text,
+            }
+            # 有校验信息或有效期才缓存
+            if item['etag'] or item['last_modified'] or item['expires'] > now:
+                self.put_item(url, item)
+        return text
+
+    # 获得缓存项: 先读内存, 再读磁盘
+    def get_item(self, url):
+        with self._lock:
+            item = self.items.get(url)
+            if item is not None:
+                self.items.move_to_end(url)
+                return item
+
+        if self.dir is None:
+            return None
+        try:
+            with open(self.get_cache_file(url), 'rb') as f:
+                item = pickle.load(f)
+        except Exception: # 缓存不存在或已损坏
+            return None
+        if item.get('url') != url: # hash冲突
+            return None
+        self.put_memory_item(url, item)
+        return item
+
+    # 写缓存项: 写内存与磁盘
+    def put_item(self, url, item):
+        self.put_memory_item(url, item)
+        if self.dir is None:
+            return
+        # 先写临时文件再改名, 防止多个进程同时写
+        cache_file = self.get_cache_file(url)
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except Exception as ex:
+            log.debug("Fail to write http cache file %s: %s", cache_file, ex)
+
+    def put_memory_item(self, url, item):
+        with self._lock:
+            self.items[url] = item
+            self.items.move_to_end(url)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    # 磁盘缓存文件
+    def get_cache_file(self, url):
+        return os.path.join(self.dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.pickle')
+
+    # 清空缓存, 包含磁盘缓存
+    def clear(self):
+        with self._lock:
+            self.items.clear()
+            self.hits = self.revalidations = self.misses = 0
+        if self.dir is not None and os.path.isdir(self.dir):
+            for name in os.listdir(self.dir):
+                if name.endswith('.pickle'):
+                    os.remove(os.path.join(self.dir, name))
+
+    # 统计
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'revalidations': self.revalidations,
+            'misses': self.misses,
+            'size': len(self.items),
+        }
+
+# 根据响应头 Cache-Control 计算过期时间戳: 有 max-age 则过期时间为 now + max-age, 否则立即过期(即每次都要发条件请求)
+def parse_expires(res, now):
+    cache_control = res.headers.get('Cache-Control', '')
+    if 'no-cache' in cache_control:
+        return 0
+    mat = re.search(r'max-age\s*=\s*(\d+)', cache_control)
+    if mat is None:
+        return 0
+    return now + int(mat.group(1))
+
+# http响应缓存, 用于 file.read_http_file()
+http_cache = HttpCache()
+
+# 设置是否启用http响应缓存
+# :param enabled 是否启用
+# :param dir 磁盘缓存的目录, 为None则只缓存在内存中
+def use_http_cache(enabled, dir = None):
+    http_cache.enabled = enabled
+    http_cache.dir = dir
+    if not enabled:
+        with http_cache._lock:
+            http_cache.items.clear()
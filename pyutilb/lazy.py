@@ -1,3 +1,4 @@
+import importlib
 from concurrent.futures.thread import ThreadPoolExecutor
 
 # 延迟计算(创建)属性装饰器: 使用 @lazyproperty 实例来代理目标对象属性的读取
@@ -15,6 +16,33 @@ class lazyproperty:
         setattr(instance, self.func.__name__, value)
         return value
 
+# 延迟导入的模块: 第一次读其属性时才导入, 用于减少导入pyutilb的耗时, 如 pd = LazyModule('pandas')
+class LazyModule(object):
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name # 模块名
+        self.__dict__['_module'] = None # 导入后的模块
+
+    # 导入模块
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return module
+
+    # 读模块属性
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return f"<LazyModule '{self.__dict__['_name']}'>"
+
 # 延迟创建的线程池集合
 class LazyThreads(object):
 
@@ -1,6 +1,7 @@
 import logging
 import logging.config
 import concurrent.futures
+import os
 import time
 from pyutilb.lazy import lazyproperty
 from configparser import ConfigParser
@@ -32,6 +33,24 @@ class AsyncLogger(object):
             AsyncLogger._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         return AsyncLogger._executor
 
+    # 积压的日志数, 即线程池中待处理的任务数
+    @staticmethod
+    def backlog():
+        if AsyncLogger._executor == None:
+            return 0
+        return AsyncLogger._executor._work_queue.qsize()
+
+    # 等待积压的日志都输出
+    @staticmethod
+    def flush():
+        if AsyncLogger._executor is not None:
+            AsyncLogger._executor.submit(lambda: None).result()
+
+    # fork出的子进程中没有父进程的日志线程, 提交到继承来的线程池的日志永远不会输出, 因此要丢弃它, 在子进程中重建
+    @staticmethod
+    def _reset_after_fork():
+        AsyncLogger._executor = None
+
     def __init__(self, name):
         self.name = name
 
@@ -68,6 +87,9 @@ class AsyncLogger(object):
         if self.logger.isEnabledFor(logging.CRITICAL):
             AsyncLogger.executor().submit(self.logger.critical, msg, *args, **kwargs)
 
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=AsyncLogger._reset_after_fork)
+
 # 获得异步日志
 def getLogger(name=None):
     return AsyncLogger(name)
@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pyutilb.log import log, AsyncLogger
+
+'''
+运行时指标的导出器: 基于标准库的http server, 以prometheus文本格式输出指标, 用于在运行中(如MonitorBoot/LocustBoot)观察吞吐量
+    默认不启用, 可通过命令行选项 --metrics-port 或调用 metrics_exporter.start(port) 来启用
+    访问: curl http://localhost:9091/metrics
+    指标包含:
+    1. Stat 的 yaml/步骤/动作计数, 以及动作与yaml文件的耗时分位数
+    2. EventLoopThreadPool/EventLoopThread 的队列深度与未完成任务数
+    3. AsyncLogger 积压的日志数
+    4. SchedulerThread 的作业延迟
+'''
+class MetricsExporter(object):
+
+    def __init__(self):
+        self.stats = {} # 统计: 名称 => Stat 或有stat属性的对象(如YamlBoot)
+        self.loop_threads = {} # 事件循环线程: 名称 => EventLoopThread
+        self.schedulers = {} # 定时器线程: 名称 => SchedulerThread
+        self.server = None
+        self.thread = None
+        self._lock = threading.Lock()
+
+    # 添加统计
+    # :param stat Stat, 或有stat属性的对象(如YamlBoot), 后者每次导出时才读其stat属性, 因为stat可能会被替换
+    # :param name 名称, 用作指标的boot标签
+    def add_stat(self, stat, name = 'default'):
+        self.stats[name] = stat
+        return self
+
+    # 添加事件循环的线程池
+    def add_pool(self, pool, name = 'default'):
+        for i, thread in enumerate(pool.threads):
+            self.loop_threads[f"{name}_{i}"] = thread
+        return self
+
+    # 添加单个事件循环线程
+    def add_loop_thread(self, thread, name = None):
+        self.loop_threads[name or thread.name] = thread
+        return self
+
+    # 添加定时器线程
+    def add_scheduler(self, scheduler, name = None):
+        self.schedulers[name or scheduler.name] = scheduler
+        return self
+
+    # 启动http server, 重复调用只启动一次
+    # :param port 端口
+    # :param host 监听的地址, 默认只监听本机, 要供其他机器(如prometheus服务)抓取则指定 0.0.0.0
+    def start(self, port = 9091, host = '127.0.0.1'):
+        with self._lock:
+            if self.server is not None:
+                return self
+            exporter = self
+            class Handler(MetricsRequestHandler):
+                def get_metrics(self):
+                    return exporter.render()
+            self.server = ThreadingHTTPServer((host, int(port)), Handler)
+            self.thread = threading.Thread(name='MetricsExporter', target=self.server.serve_forever)
+            self.thread.daemon = True
+            self.thread.start()
+            log.info("Metrics exporter listen on %s:%s", host, port)
+        return self
+
+    # 停止http server
+    def shutdown(self):
+        with self._lock:
+            if self.server is None:
+                return
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            self.thread = None
+
+    # 输出prometheus文本格式的全部指标
+    def render(self):
+        out = MetricsWriter()
+        self.render_stats(out)
+        self.render_loop_threads(out)
+        self.render_schedulers(out)
+        out.gauge('pyutilb_logger_backlog', 'Pending records in the async logger', [({}, AsyncLogger.backlog())])
+        return out.text()
+
+    # 输出统计的指标
+    def render_stats(self, out):
+        if not self.stats:
+            return
+        stats = []
+        for name, stat in list(self.stats.items()):
+            if hasattr(stat, 'stat'): # 如YamlBoot
+                stat = stat.stat
+            stats.append(({'boot': name}, stat))
+        out.counter('pyutilb_yamls_total', 'Executed yaml files', [(labels, stat.yamls) for labels, stat in stats])
+        out.counter('pyutilb_steps_total', 'Executed steps', [(labels, stat.steps) for labels, stat in stats])
+        out.counter('pyutilb_actions_total', 'Executed actions', [(labels, stat.actions) for labels, stat in stats])
+        out.summary('pyutilb_action_latency_seconds', 'Wall time of actions', 'action', [(labels, stat.action_latency) for labels, stat in stats])
+        out.summary('pyutilb_yaml_latency_seconds', 'Wall time of yaml files', 'yaml', [(labels, stat.yaml_latency) for labels, stat in stats])
+
+    # 输出事件循环线程的指标
+    def render_loop_threads(self, out):
+        if not self.loop_threads:
+            return
+        threads = list(self.loop_threads.items())
+        out.gauge('pyutilb_eventloop_queue_depth', 'Ready callbacks waiting in the event loop', [({'thread': name}, thread.queue_depth()) for name, thread in threads])
+        out.gauge('pyutilb_eventloop_tasks', 'Unfinished tasks in the event loop', [({'thread': name}, thread.task_count()) for name, thread in threads])
+
+    # 输出定时器线程的指标
+    def render_schedulers(self, out):
+        if not self.schedulers:
+            return
+        samples = []
+        for name, scheduler in list(self.schedulers.items()):
+            for job, lag in scheduler.job_lags().items():
+                samples.append(({'thread': name, 'job': job}, lag))
+        out.gauge('pyutilb_scheduler_job_lag_seconds', 'Seconds a due job is behind its scheduled run time', samples)
+
+# 指标的http请求处理器
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        try:
+            body = self.get_metrics().encode('utf-8')
+        except Exception as ex:
+            log.error("Fail to render metrics: %s", ex, exc_info = ex)
+            self.send_error(500, str(ex))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # 获得指标文本, 由导出器改写
+    def get_metrics(self):
+        return ''
+
+    # 不打印访问日志
+    def log_message(self, format, *args):
+        pass
+
+# prometheus文本格式的输出器
+class MetricsWriter(object):
+
+    def __init__(self):
+        self.lines = []
+
+    # 输出计数器
+    # :param samples 样本的列表, 元素是(标签字典, 值)
+    def counter(self, name, help, samples):
+        self.metric(name, 'counter', help, samples)
+
+    # 输出仪表
+    def gauge(self, name, help, samples):
+        self.metric(name, 'gauge', help, samples)
+
+    def metric(self, name, type, help, samples):
+        self.lines.append(f"# HELP {name} {help}")
+        self.lines.append(f"# TYPE {name} {type}")
+        for labels, val in samples:
+            self.sample(name, labels, val)
+
+    # 输出摘要: 由耗时直方图生成分位数与总数/总和
+    # :param label 直方图字典的key对应的标签名
+    # :param samples 样本的列表, 元素是(标签字典, 直方图字典)
+    def summary(self, name, help, label, samples):
+        self.lines.append(f"# HELP {name} {help}")
+        self.lines.append(f"# TYPE {name} summary")
+        for labels, histograms in samples:
+            for key, histogram in list(histograms.items()):
+                labels2 = {**labels, label: key}
+                for quantile in (50, 90, 99):
+                    self.sample(name, {**labels2, 'quantile': str(quantile / 100)}, histogram.percentile(quantile))
+                self.sample(name + '_sum', labels2, histogram.sum)
+                self.sample(name + '_count', labels2, histogram.count)
+
+    # 输出单个样本
+    def sample(self, name, labels, val):
+        if labels:
+            labels = ','.join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+            name = f"{name}{{{labels}}}"
+        self.lines.append(f"{name} {val}")
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+# 转义标签值
+def escape_label(val):
+    return str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# 默认的导出器
+metrics_exporter = MetricsExporter()
+
+if __name__ == '__main__':
+    import time
+    from pyutilb.stat import Stat
+    stat = Stat.start()
+    stat.incr_action().record_action('print', 0.0012)
+    metrics_exporter.add_stat(stat).start(9091)
+    log.info('hello')
+    print(metrics_exporter.render())
+    time.sleep(1)
@@ -9,7 +9,7 @@ https://ai.baidu.com/ai-doc/OCR/Pkrwx9ye4
 
 import sys
 import json
-import base64
+from pyutilb.file import b64encode_file
 
 # 保证兼容python2以及python3
 IS_PY3 = sys.version_info.major == 3
@@ -98,10 +98,10 @@ def recognize_text(file):
     # 拼接通用文字识别高精度url
     image_url = OCR_URL + "?access_token=" + token
     text = ""
-    # 读取测试图片
-    file_content = read_file(file)
+    # 读取测试图片, 并分块转换为base64编码
+    image = b64encode_file(file)
     # 调用文字识别服务
-    result = request(image_url, urlencode({'image': base64.b64encode(file_content)}))
+    result = request(image_url, urlencode({'image': image}))
     # 解析返回结果
     result_json = json.loads(result)
     for words_result in result_json["words_result"]:
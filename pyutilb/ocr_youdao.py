@@ -8,8 +8,8 @@ https://ai.youdao.com/DOCSIRMA/html/%E6%96%87%E5%AD%97%E8%AF%86%E5%88%ABOCR/API%
 import sys
 import uuid
 import requests
-import base64
 import hashlib
+from pyutilb.file import b64encode_file
 
 from imp import reload
 
@@ -41,9 +41,7 @@ def do_request(data):
 
 # 识别图片中的文字
 def recognize_text(file):
-    f = open(file, 'rb')  # 二进制方式打开图文件
-    q = base64.b64encode(f.read()).decode('utf-8')  # 读取文件内容，转换为base64编码
-    f.close()
+    q = b64encode_file(file)  # 分块读取文件内容并转换为base64编码, 不用先将整个文件读到内存中
 
     data = {}
     data['detectType'] = '10012'
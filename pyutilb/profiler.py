@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import cProfile
+import io
+import pstats
+import tracemalloc
+from functools import wraps
+import yaml
+from pyutilb import util
+from pyutilb.file import write_file
+from pyutilb.log import log
+
+'''
+性能分析器: 用 cProfile 与 tracemalloc 包装 YamlBoot 的执行
+    1. cpu分析: 输出pstats文件, 可用 python -m pstats 或 snakeviz 查看; 同时输出文本报告, 包含最耗时的函数, 以及通过 call_func() 调用的最耗时的系统函数/自定义函数
+    2. 内存分析: 输出每个yaml文件执行期间(包含其include的文件)内存增长最多的代码行
+    注: cProfile只分析调用 run() 的线程, tracemalloc则会跟踪所有线程
+'''
+class Profiler(object):
+
+    def __init__(self, cpu_file = None, mem_file = None, top = 20):
+        '''
+        构造函数
+        :param cpu_file: cpu分析的pstats文件, 为None则不做cpu分析
+        :param mem_file: 内存分析的报告文件, 为None则不做内存分析
+        :param top: 报告中输出前几名
+        '''
+        self.cpu_file = cpu_file
+        self.mem_file = mem_file
+        self.top = int(top or 20)
+        self.profile = None
+        self.yaml_mallocs = {} # yaml文件 => {代码行 => [内存增长, 分配次数增长]}
+
+    # 包装YamlBoot实例的方法, 以便分析每个yaml文件的内存
+    def install(self, boot):
+        if self.mem_file:
+            boot.run_1file = self.wrap_run_1file(boot.run_1file)
+        return self
+
+    # 包装run_1file(): 记录yaml文件执行前后的内存快照差异
+    def wrap_run_1file(self, func):
+        @wraps(func)
+        def wrapper(step_file, include = False):
+            before = take_snapshot()
+            try:
+                return func(step_file, include)
+            finally:
+                after = take_snapshot()
+                self.add_malloc_diffs(step_file, after.compare_to(before, 'lineno'))
+        return wrapper
+
+    # 累计yaml文件的内存差异
+    def add_malloc_diffs(self, step_file, diffs):
+        lines = self.yaml_mallocs.setdefault(step_file, {})
+        for diff in diffs:
+            if diff.size_diff <= 0:
+                continue
+            frame = diff.traceback[0]
+            line = f"{frame.filename}:{frame.lineno}"
+            item = lines.setdefault(line, [0, 0])
+            item[0] += diff.size_diff
+            item[1] += diff.count_diff
+
+    # 开始分析
+    def start(self):
+        if self.mem_file and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cpu_file:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    # 结束分析, 并输出报告
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.cpu_file)
+            write_file(self.cpu_file + '.txt', self.cpu_report())
+            log.info("Write cpu profile to %s", self.cpu_file)
+        if self.mem_file:
+            tracemalloc.stop()
+            write_file(self.mem_file, yaml.dump(self.mem_report(), allow_unicode=True, sort_keys=False))
+            log.info("Write memory profile to %s", self.mem_file)
+
+    # cpu分析的文本报告
+    def cpu_report(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        out.write(f"Hottest functions called via call_func():\n")
+        out.write(f"{'ncalls':>10} {'tottime':>10} {'cumtime':>10}  function\n")
+        for name, nc, tt, ct in self.hot_funcs(stats):
+            out.write(f"{nc:>10} {tt:>10.3f} {ct:>10.3f}  {name}\n")
+        return out.getvalue()
+
+    # 通过 call_func() 调用的最耗时的系统函数/自定义函数
+    # :return 列表, 元素是(函数名, 调用次数, 自身耗时, 累计耗时), 按累计耗时降序
+    def hot_funcs(self, stats):
+        caller = func_key(util.call_func)
+        funcs = {**util.sys_funcs, **util.custom_funs}
+        ret = []
+        for name, func in funcs.items():
+            key = func_key(func)
+            if key is None or key not in stats.stats:
+                continue
+            callers = stats.stats[key][4]
+            if caller not in callers:
+                continue
+            cc, nc, tt, ct = callers[caller]
+            ret.append((name, nc, tt, ct))
+        ret.sort(key=lambda item: item[3], reverse=True)
+        return ret[:self.top]
+
+    # 内存分析的报告: 每个yaml文件内存增长最多的代码行
+    def mem_report(self):
+        report = {}
+        for step_file, lines in self.yaml_mallocs.items():
+            items = sorted(lines.items(), key=lambda item: item[1][0], reverse=True)[:self.top]
+            report[step_file] = {
+                'size_diff_kb': round(sum(size for size, _ in lines.values()) / 1024, 1),
+                'top': [{'line': line, 'size_diff_kb': round(size / 1024, 1), 'count_diff': count} for line, (size, count) in items]
+            }
+        return report
+
+# 内存快照: 排除tracemalloc与本分析器自身的内存分配, 如include的文件的快照与内存差异
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+# 获得函数在pstats中的key: (文件, 行号, 函数名)
+def func_key(func):
+    code = getattr(func, '__code__', None)
+    if code is None: # 内置函数等
+        return None
+    return (code.co_filename, code.co_firstlineno, code.co_name)
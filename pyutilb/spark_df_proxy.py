@@ -16,4 +16,10 @@ class SparkDfProxy(object):
         return len(self.data)
 
     def __getitem__(self, key):
-        return self.data[key]
\ No newline at end of file
+        return self.data[key]
+
+    # 迭代: 已collect()则迭代缓存的数据, 否则逐个分区拉取数据, 不用一次性收集全部数据到driver的内存中
+    def __iter__(self):
+        if 'data' in self.__dict__:
+            return iter(self.data)
+        return self.df.toLocalIterator()
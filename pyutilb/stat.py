@@ -2,9 +2,104 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import time
 from pyutilb.util import *
 from pyutilb.file import *
 
+# 耗时直方图: 仿HDR直方图, 按对数-线性分桶, 相对误差不超过 1/sub_buckets
+#    耗时以微秒为单位取整, 小于 2*sub_buckets 的值每个值一个桶, 更大的值则每翻倍一次分 sub_buckets 个桶
+#    记录时只需计算桶下标并计数, 开销很低, 可在压测中常开
+class Histogram(object):
+
+    sub_bits = 4 # 每翻倍一次的子桶数为 2^sub_bits
+    sub_buckets = 1 << sub_bits
+
+    def __init__(self):
+        self.buckets = {} # 桶下标 => 次数
+        self.count = 0
+        self.sum = 0.0 # 总耗时, 单位秒
+        self.max = 0.0 # 最大耗时, 单位秒
+
+    # 记录耗时
+    # :param cost 耗时, 单位秒
+    def record(self, cost):
+        self.count += 1
+        self.sum += cost
+        if cost > self.max:
+            self.max = cost
+        idx = self.bucket_index(int(cost * 1000000))
+        buckets = self.buckets
+        buckets[idx] = buckets.get(idx, 0) + 1
+
+    # 计算微秒值所在的桶下标
+    @classmethod
+    def bucket_index(cls, us):
+        if us < cls.sub_buckets << 1:
+            return us if us > 0 else 0
+        shift = us.bit_length() - cls.sub_bits - 1
+        return (shift << cls.sub_bits) + (us >> shift)
+
+    # 计算桶的值范围(下限, 上限), 单位微秒
+    @classmethod
+    def bucket_range(cls, idx):
+        if idx < cls.sub_buckets << 1:
+            return idx, idx + 1
+        shift = (idx >> cls.sub_bits) - 1
+        low = (idx - (shift << cls.sub_bits)) << shift
+        return low, low + (1 << shift)
+
+    # 计算百分位的耗时, 取桶的中值, 单位秒
+    # :param percent 百分位, 如 99
+    def percentile(self, percent):
+        if self.count == 0:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= target:
+                low, high = self.bucket_range(idx)
+                return min((low + high) / 2000000, self.max)
+        return self.max
+
+    # 合并其他直方图
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        return self
+
+    # 转字典, 耗时单位为毫秒
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum * 1000, 3),
+            'p50': round(self.percentile(50) * 1000, 3),
+            'p90': round(self.percentile(90) * 1000, 3),
+            'p99': round(self.percentile(99) * 1000, 3),
+            'max': round(self.max * 1000, 3),
+        }
+
+# 记录耗时到直方图中
+# :param histograms 直方图的字典, key是名称
+# :param name 名称
+# :param cost 耗时, 单位秒
+def record_latency(histograms, name, cost):
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = Histogram()
+    histogram.record(cost)
+
+# 合并直方图的字典
+def merge_latencies(histograms, others):
+    for name, other in others.items():
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.merge(other)
+
 # 对测试进行统计
 class Stat(object):
 
@@ -16,10 +111,14 @@ class Stat(object):
         # 记录yaml文件
         self.yaml_tree = []
         self.yaml_levels = []  # 当前yaml节点的路径, 包含每一层的下标
+        self.yaml_starts = []  # 当前yaml节点的路径上, 每一层的开始时间
         # 统计yaml文件、步骤、动作
         self.yamls = 0
         self.steps = 0
         self.actions = 0
+        # 耗时直方图: 动作名/yaml文件 => 直方图
+        self.action_latency = {}
+        self.yaml_latency = {}
         # 记录错误
         self.err = None
         # 结束后的变量
@@ -38,7 +137,7 @@ class Stat(object):
             err = str(err)
         self.err = err
         # 记录变量, 要去掉不关心的变量
-        self.vars = get_vars()
+        self.vars = get_vars(True)
         if 'boot' in self.vars:
             del self.vars['boot']
         if 'response' in self.vars:
@@ -46,14 +145,17 @@ class Stat(object):
         # 将统计结果输出到 result.yml
         data = self.to_dict()
         ret = yaml.dump(data)
-        write_file('stat.yml', ret)
+        write_file('stat.yml', ret, atomic=True)
         return self
 
     # 转字典
     def to_dict(self):
-        data = self.__dict__
-        if 'yaml_levels' in data:
-            del data['yaml_levels']
+        data = dict(self.__dict__)
+        del data['yaml_levels']
+        del data['yaml_starts']
+        # 直方图转字典
+        data['action_latency'] = {name: histogram.to_dict() for name, histogram in self.action_latency.items()}
+        data['yaml_latency'] = {name: histogram.to_dict() for name, histogram in self.yaml_latency.items()}
         return data
 
     # 步骤数+1
@@ -66,28 +168,64 @@ class Stat(object):
         self.actions += 1
         return self
 
+    # 记录动作耗时
+    # :param action 动作名
+    # :param cost 耗时, 单位秒
+    def record_action(self, action, cost):
+        record_latency(self.action_latency, action, cost)
+        return self
+
     # 开始执行一个yaml文件
     def enter_yaml(self, yaml):
         self.yamls += 1
         i = self._add_yaml_node(yaml)  # 记录yaml文件
         self.yaml_levels.append(i)  # 记录新层的下标
+        self.yaml_starts.append(time.perf_counter())  # 记录新层的开始时间
         return self
 
     # 结束执行一个yaml文件
     def exit_yaml(self):
+        # 记录耗时: 耗时记录到yaml节点中, 并按yaml文件汇总到直方图
+        cost = time.perf_counter() - self.yaml_starts.pop()
+        node = self._current_node()
+        node['cost'] = round(cost * 1000, 3) # 单位毫秒
+        record_latency(self.yaml_latency, node['yaml'], cost)
         self.yaml_levels.pop()  # 干掉本层
         return self
 
     # 往yaml树中添加yaml节点
     def _add_yaml_node(self, yaml):
         # 找到当前层的子节点
-        children = self.yaml_tree
-        for idx in self.yaml_levels:
-            children = children[idx]['children']
+        children = self._current_children()
         # 添加
         children.append({'yaml': yaml, 'children': []})
         return len(children) - 1
 
+    # 当前层的yaml节点
+    def _current_node(self):
+        children = self.yaml_tree
+        for idx in self.yaml_levels[:-1]:
+            children = children[idx]['children']
+        return children[self.yaml_levels[-1]]
+
+    # 当前层的子节点
+    def _current_children(self):
+        children = self.yaml_tree
+        for idx in self.yaml_levels:
+            children = children[idx]['children']
+        return children
+
+    # 合并其他统计, 如并行迭代的统计
+    def merge(self, other):
+        self.yamls += other.yamls
+        self.steps += other.steps
+        self.actions += other.actions
+        merge_latencies(self.action_latency, other.action_latency)
+        merge_latencies(self.yaml_latency, other.yaml_latency)
+        # 其他统计的yaml节点挂到当前层
+        self._current_children().extend(other.yaml_tree)
+        return self
+
     # 当前层yaml的路径
     def current_level_yamls(self):
         yamls = []
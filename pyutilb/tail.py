@@ -2,13 +2,19 @@
 # 参考: https://github.com/kasun/python-tail/blob/master/tail.py
 # 改进: 使用 asyncio
 import asyncio
+import glob
 import os
+import re
 import sys
 import threading
 import time
 from apscheduler.util import iscoroutinefunction_partial
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from pyutilb.compression import open_file
+from pyutilb.file_async import run_in_file_executor
 
+# 读日志分割出来的旧文件时, 每批读的字符数
+rotated_batch_size = 65536
 
 class Tail(object):
     """
@@ -31,13 +37,15 @@ class Tail(object):
     """
 
     ''' Represents a tail command. '''
-    def __init__(self, path, scheduler: AsyncIOScheduler = None, from_end = True):
+    def __init__(self, path, scheduler: AsyncIOScheduler = None, from_end = True, read_rotated = False):
         ''' Initiate a Tail instance.
             Check for file validity, assigns callback function to standard out.
 
             Arguments:
                 path - File to be followed.
                 scheduler - AsyncIOScheduler.
+                from_end - 是否从文件末尾开始读
+                read_rotated - 开始跟踪前, 是否先读日志分割出来的旧文件(如 a.log.1, a.log.2.gz, a.log-20230423.gz), 支持gz/bz2/xz压缩文件
         '''
         # 文件
         self.path = self.check_file_valid(path)
@@ -53,6 +61,10 @@ class Tail(object):
         # 回调
         self.callback = sys.stdout.write
 
+        # 是否读日志分割出来的旧文件, 读完之前不读当前文件
+        self.read_rotated = read_rotated
+        self.reading_rotated = False
+
     def check_file_valid(self, path):
         """ Check whether the a given file exists, readable and is a file """
         if not os.access(path, os.F_OK):
@@ -63,6 +75,35 @@ class Tail(object):
             raise Exception("File '%s' is a directory" % (path))
         return path
 
+    def rotated_files(self):
+        """ 日志分割出来的旧文件, 如 a.log.1, a.log.2.gz, a.log-20230423.gz, 按修改时间从旧到新排序 """
+        prefix = glob.escape(self.path)
+        files = set(glob.glob(prefix + '.*') + glob.glob(prefix + '-*'))
+        # 只要 数字/日期 + 可选的压缩扩展名 的后缀
+        reg = re.compile(re.escape(self.path) + r'[.-][\d.-]+(\.(gz|bz2|xz))?$')
+        files = [f for f in files if reg.match(f)]
+        return sorted(files, key=os.path.getmtime)
+
+    async def read_rotated_lines(self):
+        """ 读日志分割出来的旧文件的每一行, 并回调
+            压缩文件边读边解压; 读文件与解压都在文件io线程池中分批执行, 以免大文件阻塞事件循环
+        """
+        self.reading_rotated = True
+        try:
+            for file in await run_in_file_executor(self.rotated_files):
+                f = await run_in_file_executor(open_file, file, 'r')
+                try:
+                    while True:
+                        lines = await run_in_file_executor(f.readlines, rotated_batch_size) # 每批约64K字符
+                        if not lines:
+                            break
+                        for line in lines:
+                            await self.call_callback(line)
+                finally:
+                    f.close()
+        finally:
+            self.reading_rotated = False
+
     def reload_file(self):
         """ Reload tailed file when it be empty be `echo "" > tailed file`, or segmentated by logrotate.
             从头开始读
@@ -100,6 +141,9 @@ class Tail(object):
             self.scheduler.start()
 
         # 添加定时任务
+        if self.read_rotated: # 先读日志分割出来的旧文件
+            self.reading_rotated = True
+            self.scheduler.add_job(self.read_rotated_lines, id=f'tail-rotated:{self.path}')
         self.scheduler.add_job(self.read_line, 'interval', seconds=interval, id=f'tail:{self.path}')
 
         # 启动定时事件循环
@@ -107,10 +151,15 @@ class Tail(object):
             asyncio.get_event_loop().run_forever()
 
     async def read_line(self):
+        if self.reading_rotated: # 旧文件未读完
+            return
         await self.check_file_size()
         # 读行
         line = self.file.readline()
         # 回调
+        await self.call_callback(line)
+
+    async def call_callback(self, line):
         if line and line != "\n": # 忽略空+换行符
             if iscoroutinefunction_partial(self.callback):
                 await self.callback(line)
@@ -125,6 +174,11 @@ class Tail(object):
             return
 
         # 2 异常, 文件被清空或日志分割
+        # 日志分割是将当前文件改名, 打开的文件还是原文件, 先读完其剩余的行, 以免丢失
+        old_file = self.file
+        for line in old_file:
+            await self.call_callback(line)
+        old_file.close()
         try_count = 0
         while try_count < 10:
             # 尝试从头开始
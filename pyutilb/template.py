@@ -1,4 +1,8 @@
-from mako.template import Template
+from pyutilb.file import file_cache
+from pyutilb.lazy import LazyModule
+
+# 延迟导入mako, 减少导入pyutilb的耗时
+mako_template = LazyModule('mako.template')
 
 def render_mako(vars = None, **args):
     '''
@@ -10,7 +14,7 @@ def render_mako(vars = None, **args):
     if vars is None:
         vars = {}
     # 定义模板
-    mytemplate = Template(**args)
+    mytemplate = mako_template.Template(**args)
     # 渲染模板
     return mytemplate.render(**vars)
 
@@ -32,6 +36,21 @@ def render_file(file, vars = None):
     '''
     return render_mako(vars, filename = file)
 
+def render_file_cached(file, vars = None):
+    '''
+    渲染模板文件, 编译好的模板有缓存, 文件修改后才重新编译
+    :param file: 模板文件
+    :param vars: 模板参数
+    :return:
+    '''
+    if vars is None:
+        vars = {}
+    tpl = file_cache.read(file, load=load_template_file)
+    return tpl.render(**vars)
+
+def load_template_file(file):
+    return mako_template.Template(filename=file)
+
 if __name__ == '__main__':
     tpl = '<title>${title}</title>'
     print(render_text(tpl, {'title': 'hero'}))
\ No newline at end of file
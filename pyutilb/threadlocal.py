@@ -1,9 +1,12 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-from threading import Thread, get_ident
+import asyncio
+from contextvars import ContextVar
+from threading import Thread, local
 
 # 仿java实现，让local支持默认值
+# 基于 threading.local 实现, 线程结束时其变量会被自动清理, 不会因线程id重用而串值或泄漏
 class ThreadLocal(object):
 
     def __init__(self, default = None):
@@ -11,20 +14,20 @@ class ThreadLocal(object):
         构造函数
         :param default: 默认值，可能是函数
         '''
-        self.locals = {}
+        self.locals = local()
         self.default = default
 
     # 设置local变量
     def set(self, value):
-        ident = get_ident()
-        self.locals[ident] = value
+        self.locals.value = value
 
     # 获得local变量
     def get(self):
-        ident = get_ident()
-        if ident not in self.locals:
-            self.locals[ident] = self._get_default_val()
-        return self.locals[ident]
+        try:
+            return self.locals.value
+        except AttributeError:
+            value = self.locals.value = self._get_default_val()
+            return value
 
     # 构造默认值
     def _get_default_val(self):
@@ -32,13 +35,69 @@ class ThreadLocal(object):
             return self.default()
         return self.default
 
+# 获得当前的asyncio任务, 不在事件循环中则返回None
+def current_task():
+    if asyncio._get_running_loop() is None:
+        return None
+    return asyncio.current_task()
+
+# 上下文的local: 在线程中跟 ThreadLocal 一样, 在asyncio任务中则每个任务独立一份
+# 如同一个 EventLoopThread 上的多个协程, 各有各的变量, 互不干扰
+class ContextLocal(ThreadLocal):
+
+    def __init__(self, default = None, inherit = None):
+        '''
+        构造函数
+        :param default: 默认值，可能是函数
+        :param inherit: 构造任务的初始值的函数, 参数是父任务的值(没有父任务则是当前线程的值), 为None则任务的初始值为默认值
+        '''
+        super().__init__(default)
+        self.inherit = inherit
+        # 值为元组(所属任务, 值), 因为子任务会复制父任务的上下文, 要用所属任务来识别是否是自己的值
+        self.context_var = ContextVar(f'ContextLocal_{id(self)}', default = None)
+
+    # 设置local变量
+    def set(self, value):
+        task = current_task()
+        if task is None:
+            super().set(value)
+            return
+        self.context_var.set((task, value))
+
+    # 获得local变量
+    def get(self):
+        task = current_task()
+        if task is None:
+            return super().get()
+        item = self.context_var.get()
+        if item is None or item[0] is not task:
+            item = (task, self._get_task_default_val(item))
+            self.context_var.set(item)
+        return item[1]
+
+    # 构造任务的初始值
+    # :param parent_item 从父任务复制过来的上下文中的值, 为元组(父任务, 值)
+    def _get_task_default_val(self, parent_item):
+        if self.inherit is None:
+            return self._get_default_val()
+        parent = parent_item[1] if parent_item is not None else super().get()
+        return self.inherit(parent)
+
 
 if __name__ == '__main__':
-    num = ThreadLocal()
+    num = ContextLocal()
     print(num.get())
     def task(arg):
         num.set(arg)
         print(num.get())
     for i in range(10):
         t = Thread(target=task, args=(i,))
-        t.start()
\ No newline at end of file
+        t.start()
+
+    async def coroutine(arg):
+        num.set(arg)
+        await asyncio.sleep(0.1)
+        print(f"task {arg}: {num.get()}")
+    async def main():
+        await asyncio.gather(*[coroutine(i) for i in range(3)])
+    asyncio.run(main())
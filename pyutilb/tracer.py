@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+from functools import wraps
+from pyutilb.threadlocal import ThreadLocal
+from pyutilb.util import get_var
+
+'''
+执行过程的跟踪器: 记录yaml文件/步骤/动作的执行区间, 输出为 Chrome Trace Event 格式的json文件
+    可用 chrome://tracing 或 https://ui.perfetto.dev 打开, 以时间线的方式查看哪个include文件或循环体最耗时
+    启用时才会将 YamlBoot 实例的 run_1file/run_steps/run_action/run_action_plan 方法替换为带跟踪的包装方法, 未启用时没有任何开销
+    区间类型(cat):
+    1. yaml: 执行单个步骤文件, 名称是文件路径
+    2. steps: 执行多个步骤, 如果是for循环的一次迭代, 则名称是 #迭代次数
+    3. action: 执行单个动作, 名称是动作名
+    4. loop: 执行for循环的动作, 名称是动作名, 如 for(3)
+    5. include: 执行include动作, 名称是 include 文件路径
+'''
+class Tracer(object):
+
+    # 动作名 => 区间类型
+    action_cats = {
+        'for': 'loop',
+        'for_parallel': 'loop',
+        'for_parallel_process': 'loop',
+        'include': 'include',
+    }
+
+    def __init__(self, file = 'trace.json'):
+        '''
+        构造函数
+        :param file: 输出的json文件
+        '''
+        self.file = file
+        self.pid = os.getpid()
+        self.events = [] # list.append()是线程安全的
+        self.thread_names = {} # 线程id => 线程名
+        self.stacks = ThreadLocal(list) # 每个线程当前所在区间的类型栈, 用于识别循环的迭代
+
+    # 包装YamlBoot实例的方法, 以便跟踪其执行
+    def install(self, boot):
+        boot.run_1file = self.wrap(boot.run_1file, lambda step_file, include = False: ('yaml', step_file))
+        boot.run_steps = self.wrap(boot.run_steps, self.steps_span)
+        boot.run_action = self.wrap(boot.run_action, lambda action, param: self.action_span(action.split('(', 1)[0], action, param))
+        boot.run_action_plan = self.wrap(boot.run_action_plan, lambda ap: self.action_span(ap.name, ap.action, ap.param))
+        return self
+
+    # 步骤区间: 父区间是循环, 则是一次迭代
+    def steps_span(self, steps):
+        stack = self.stacks.get()
+        if stack and stack[-1] == 'loop':
+            return 'steps', f"#{get_var('for_i', False)}"
+        return 'steps', 'steps'
+
+    # 动作区间
+    def action_span(self, name, action, param):
+        cat = self.action_cats.get(name, 'action')
+        if cat == 'include':
+            return cat, f"include {param}"
+        return cat, action
+
+    # 包装函数: 记录函数执行的区间
+    # :param func 被包装的函数
+    # :param get_span 根据函数参数获得区间信息的函数, 返回(类型, 名称)
+    def wrap(self, func, get_span):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cat, name = get_span(*args, **kwargs)
+            stack = self.stacks.get()
+            stack.append(cat)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter_ns()
+                stack.pop()
+                self.add_event(cat, name, start, end)
+        return wrapper
+
+    # 添加一个完整区间的事件
+    def add_event(self, cat, name, start, end):
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append({
+            'name': name,
+            'cat': cat,
+            'ph': 'X', # 完整区间, 包含开始时间与耗时
+            'ts': start / 1000, # 单位微秒
+            'dur': (end - start) / 1000,
+            'pid': self.pid,
+            'tid': tid,
+        })
+
+    # 转为 Chrome Trace Event 格式
+    def to_dict(self):
+        # 线程名的元数据
+        metas = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in list(self.thread_names.items())]
+        return {
+            'traceEvents': metas + list(self.events),
+            'displayTimeUnit': 'ms',
+        }
+
+    # 输出json文件
+    def dump(self, file = None):
+        file = file or self.file
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        return file
@@ -2,20 +2,30 @@
 # -*- coding: utf-8 -*-
 import re
 import os
+import ast
+import builtins
+import operator
 import socket
 import sys
 import random
+import threading
 from collections import deque
 from typing import Union
-from functools import wraps
+from functools import wraps, lru_cache
 from pyutilb.template import *
 from pyutilb.spark_df_proxy import SparkDfProxy
 from pyutilb.strs import substr_before
 from pyutilb import ts
-from pyutilb.threadlocal import ThreadLocal
+from pyutilb.threadlocal import ThreadLocal, ContextLocal
+from pyutilb.vars_scope import VarsScope
+from pyutilb.atomic import AtomicInteger
 from pyutilb.file import *
-import pandas as pd
+from pyutilb.lazy import LazyModule
 import hashlib
+import yaml
+
+# 延迟导入pandas, 减少导入pyutilb的耗时
+pd = LazyModule('pandas')
 
 # -------------------- 帮助方法 ----------------------
 # 输出异常
@@ -47,8 +57,11 @@ def replace_sysarg(cmd):
     return re.sub(r'\$([\w\d_]+)', replace, cmd)  # 处理变量
 
 # 构建md5 hash
+# :param str 字符串, 也支持bytes/memoryview(如 read_byte_file_mmap() 的结果), 不用再复制一份; 大文件请用 file_md5()
 def md5(str):
-    m = hashlib.md5(str.encode(encoding='utf-8'))
+    if hasattr(str, 'encode'):
+        str = str.encode(encoding='utf-8')
+    m = hashlib.md5(str)
     return m.hexdigest()  # 转化为16进制
 
 # 获得并删除字典中的项目
@@ -83,8 +96,18 @@ def extend_list(list, n, val = None):
         list.append(val)
 
 # -------------------- 变量读写+表达式解析与执行 ----------------------
-# 变量栈
-vars_stacks = ThreadLocal(lambda : deque())
+# 变量栈, 元素是 VarsScope; 每个线程或asyncio任务各有一个
+# asyncio任务的变量栈: 栈底是叠加在父任务(或线程)栈顶之上的作用域, 因此能读到启动事件循环前设置的变量(如命令行的-d变量), 写的变量则互不干扰
+def inherit_vars_stack(parent_stack):
+    stack = deque()
+    if parent_stack:
+        stack.append(VarsScope(parent_stack[-1]))
+    return stack
+
+vars_stacks = ContextLocal(deque, inherit_vars_stack)
+
+# 输出yaml时当作普通dict
+yaml.add_representer(VarsScope, yaml.representer.SafeRepresenter.represent_dict)
 
 # 获取全部变量
 def get_vars(copy = False):
@@ -92,7 +115,7 @@ def get_vars(copy = False):
     stack = vars_stacks.get()
     # 获得栈顶元素=变量
     if len(stack) == 0: # 空则插入一个
-        stack.append({})
+        stack.append(VarsScope())
     ret = stack[-1]
     if copy:
         return ret.copy()
@@ -102,11 +125,11 @@ def get_vars(copy = False):
 def push_vars_stack():
     # 获得变量栈
     stack = vars_stacks.get()
-    # 复制栈顶元素=变量，因此boot框架需要访问所有设置过的变量
+    # 新建一层作用域, 读不到的变量再读上一层，因此boot框架能访问所有设置过的变量, 同时不用复制上一层的变量
     if len(stack) == 0:
-        vars = {}
+        vars = VarsScope()
     else:
-        vars = stack[-1].copy()
+        vars = VarsScope(stack[-1])
     # 入栈
     stack.append(vars)
 
@@ -121,25 +144,25 @@ def pop_vars_stack(write_back):
         return None
     # 出栈
     ret = stack.pop()
-    # 回写上一层的变量
+    # 回写上一层的变量: 只回写本层改过的, 且上一层已有的变量
     if write_back and len(stack) > 0:
         vars = stack[-1]
-        for k in vars.keys():
-            if vars[k] != ret[k]:
-                vars[k] = ret[k]
+        for k, v in ret.dirty_items():
+            if k in vars:
+                vars[k] = v
     return ret
 
 # 获取单个变量
 # :param name 变量名
 # :param throw_key_exception 当变量不存在，是否抛异常
 def get_var(name, throw_key_exception = True):
-    if name not in get_vars():
+    try:
+        return get_vars()[name]
+    except KeyError:
         if throw_key_exception:
             raise Exception(f'Variable not exist: {name}')
         return None
 
-    return get_vars()[name]
-
 # 设置单个变量
 def set_var(name, val):
     get_vars()[name] = val
@@ -182,39 +205,49 @@ def now(_):
     return ts.now2str()
 
 base_str = 'ABCDEFGHIGKLMNOPQRSTUVWXYZabcdefghigklmnopqrstuvwxyz0123456789'
+digit_str = '0123456789'
+
+# 每个线程一个随机数生成器, 避免多线程争用全局的random
+thread_randoms = ThreadLocal(random.Random)
+
+# 获得当前线程的随机数生成器
+def get_random():
+    return thread_randoms.get()
+
 # 生成一个指定长度的随机字符串
 def random_str(n):
-    n = int(n)
-    random_str = ''
-    length = len(base_str) - 1
-    for i in range(n):
-        random_str += base_str[random.randint(0, length)]
-    return random_str
+    return ''.join(get_random().choices(base_str, k=int(n)))
 
 # 生成一个指定长度的随机数字
 def random_int(n):
-    n = int(n)
-    random_str = ''
-    for i in range(n):
-        random_str += str(random.randint(0, 9))
-    return random_str
+    return ''.join(get_random().choices(digit_str, k=int(n)))
 
 # 从list变量中随机挑选一个元素
 def random_element(var):
     items = get_var(var)
-    if isinstance(items, list, tuple, set, range):
+    if not isinstance(items, (list, tuple, set, range)):
         raise Exception('Param in random_element(param) must be list/tuple/set/range/range type')
-    return random.choice(items)
+    if isinstance(items, set):
+        items = list(items)
+    return get_random().choice(items)
 
-# 自增的值
+# 自增的值: key为自增的键, value为AtomicInteger
 incr_vals = {}
-
-# 自增值，从1开始
+incr_lock = threading.Lock()
+
+# 获得自增的计数器
+def get_incr_counter(key):
+    counter = incr_vals.get(key)
+    if counter is None:
+        with incr_lock:
+            counter = incr_vals.get(key)
+            if counter is None:
+                counter = incr_vals[key] = AtomicInteger()
+    return counter
+
+# 自增值，从1开始, 线程安全
 def incr(key):
-    if key not in incr_vals:
-        incr_vals[key] = 0
-    incr_vals[key] = incr_vals[key] + 1
-    return incr_vals[key]
+    return get_incr_counter(key).inc()
 
 # 获得list变量长度
 def get_len(var):
@@ -318,6 +351,15 @@ def do_replace_var(txt, to_str = True, replace = replace_pure_var_expr):
     if '$' not in txt: # 无需替换
         return txt
 
+    # 自定义替换函数 或 文本中含有占位符: 走正则替换
+    if replace is not replace_pure_var_expr or var_placeholder_char in txt:
+        return do_replace_var_by_regex(txt, to_str, replace)
+
+    # 编译(有缓存)后再渲染
+    return compile_var_template(txt).render(to_str)
+
+# 用正则来替换变量, 每次都要重新匹配
+def do_replace_var_by_regex(txt, to_str = True, replace = replace_pure_var_expr):
     # 1 整体匹配: 整个是纯变量表达式
     for reg in reg_exprs:
         mat = re.match(rf'{reg}$', txt) # match是从头开始匹配，但管头不管尾，因此要加上 $
@@ -331,6 +373,107 @@ def do_replace_var(txt, to_str = True, replace = replace_pure_var_expr):
     txt = re.sub(r'\\\$', '$', txt)  # 将 \$ 反转义为 $, jkmvc调用php controller时url有$
     return txt
 
+# -------------------- 变量表达式的编译 ----------------------
+# 预编译的正则: 整体匹配 + 局部匹配
+reg_exprs_whole = [re.compile(rf'{reg}$') for reg in reg_exprs]
+reg_exprs_part = [re.compile(rf'(?<!\\){reg}') for reg in reg_exprs]
+# 编译时用来代替变量表达式的占位符, 如 \x000\x00 表示第0个变量表达式
+var_placeholder_char = '\x00'
+reg_var_placeholder = re.compile(r'\x00(\d+)\x00')
+# 嵌套在 ${...} 中的占位符
+reg_nested_placeholder = re.compile(r'\$\{[^}]*\x00')
+# 编译结果的缓存大小
+var_template_cache_size = 4096
+
+# 变量表达式的引用, 渲染时才解析表达式的值
+class VarRef(object):
+    __slots__ = ('expr', 'parts')
+
+    def __init__(self, expr, parts = None):
+        self.expr = expr # 表达式, 如 data.msg
+        self.parts = parts # 表达式中嵌套了其他变量时, 由 字符串 + VarRef 组成的片段, 如 random_str($n)
+
+    # 解析表达式的值
+    def eval(self):
+        expr = self.expr
+        if self.parts is not None:
+            expr = join_var_parts(self.parts)
+        return analyze_var_expr(expr)
+
+# 拼接 字符串 + VarRef 组成的片段
+def join_var_parts(parts):
+    return ''.join([p if p.__class__ is str else str(p.eval()) for p in parts])
+
+# 将带占位符的字符串拆分为 字符串 + VarRef 组成的片段
+def split_var_placeholders(txt, refs):
+    parts = reg_var_placeholder.split(txt) # 奇数下标是占位符中的序号
+    for i in range(1, len(parts), 2):
+        parts[i] = refs[int(parts[i])]
+    return [p for p in parts if p != '']
+
+# 编译好的变量表达式模板
+class VarTemplate(object):
+    __slots__ = ('expr', 'parts', 'txt')
+
+    def __init__(self, expr = None, parts = None, txt = None):
+        self.expr = expr # 整体匹配的表达式
+        self.parts = parts # 局部匹配时, 由 字符串 + VarRef 组成的片段
+        self.txt = txt # 不能编译的原文本, 渲染时走正则替换
+
+    # 渲染
+    # :param to_str 是否转为字符串, 只针对整体匹配的情况
+    def render(self, to_str = True):
+        # 0 不能编译: 走正则替换
+        if self.txt is not None:
+            return do_replace_var_by_regex(self.txt, to_str)
+
+        # 1 整体匹配
+        if self.expr is not None:
+            r = analyze_var_expr(self.expr)
+            if to_str:
+                return str(r)
+            return r
+
+        # 2 局部匹配
+        txt = join_var_parts(self.parts)
+        if '\\$' in txt:
+            txt = txt.replace('\\$', '$')  # 将 \$ 反转义为 $
+        return txt
+
+# 编译变量表达式的模板: 只匹配一次正则, 结果按字符串缓存
+# 局部匹配时依然按 reg_exprs 的顺序多轮替换, 只是用占位符代替变量值, 以便保持跟 do_replace_var_by_regex() 一样的匹配结果
+@lru_cache(maxsize=var_template_cache_size)
+def compile_var_template(txt):
+    # 1 整体匹配: 整个是纯变量表达式
+    for reg in reg_exprs_whole:
+        mat = reg.match(txt)
+        if mat:
+            expr = mat.group(1)
+            if expr.isnumeric(): # 数字(如$1)则原样返回
+                return VarTemplate(parts=[mat.group()])
+            return VarTemplate(expr)
+
+    # 2 局部匹配: 由 普通字符串 + 变量表达式 组成
+    refs = []
+    def replace(mat):
+        expr = mat.group(1)
+        if expr.isnumeric(): # 数字(如$1)则原样返回
+            return mat.group()
+        if var_placeholder_char in expr: # 表达式中嵌套了前几轮替换的变量, 如 ${random_str($n)}
+            ref = VarRef(None, split_var_placeholders(expr, refs))
+        else:
+            ref = VarRef(expr)
+        refs.append(ref)
+        return f'{var_placeholder_char}{len(refs) - 1}{var_placeholder_char}'
+
+    origin = txt
+    for reg in reg_exprs_part:
+        txt = reg.sub(replace, txt)
+    # 变量嵌套在外层表达式中, 如 ${data.$k}: 替换为占位符后, 后几轮的正则匹配不到外层表达式, 而逐轮替换变量值时则能匹配到, 因此不能编译
+    if reg_nested_placeholder.search(txt):
+        return VarTemplate(txt=origin)
+    return VarTemplate(parts=split_var_placeholders(txt, refs))
+
 # 解析变量表达式
 # :param expr 变量表达式
 # :return 表达式的值
@@ -341,7 +484,7 @@ def analyze_var_expr(expr):
             return parse_and_call_func(expr)
 
         if '.' in expr:  # 有多级属性, 如 data.msg
-            return jsonpath(get_vars(), '$.' + expr)[0]
+            return get_var_by_path(expr)
 
         if '[' in expr:  # 有属性, 如 df[name]
             return parse_df_props(expr)
@@ -351,6 +494,37 @@ def analyze_var_expr(expr):
         raise ValueError(f"解析变量表达式`{expr}`出错: {e}") from e
 
 
+# 多级属性路径中的单个属性名: 不能包含jsonpath的特殊字符, 否则交给jsonpath处理
+reg_path_prop = r"@?[^\.\[\]\(\)\*\?'\"\$:!@;#,\s]+"
+# 多级属性路径的正则: 只支持简单的属性与下标, 如 data.msg / data.list[0].name / data.@name / 数据.名称
+reg_path = re.compile(rf"{reg_path_prop}(\.{reg_path_prop}|\[{reg_path_prop}\])*$")
+reg_path_split = re.compile(rf"\.|\[|\]")
+
+# 编译多级属性路径为属性名的元组, 如 data.list[0] 编译为 ('data', 'list', '0')
+# :return 属性名的元组, 如果不是简单路径(如有过滤/通配等语法)则返回None
+@lru_cache(maxsize=var_template_cache_size)
+def compile_var_path(expr):
+    if not reg_path.match(expr):
+        return None
+    return tuple(p for p in reg_path_split.split(expr) if p != '')
+
+# 按多级属性路径来获得变量值, 如 data.msg
+# 简单路径直接逐级取值, 跟jsonpath的取值规则一致: dict按key取值, list按数字下标取值; 复杂路径则交给jsonpath
+def get_var_by_path(expr):
+    props = compile_var_path(expr)
+    if props is None:
+        return jsonpath(get_vars(), '$.' + expr)[0]
+
+    val = get_vars()
+    for prop in props:
+        if isinstance(val, dict) and prop in val:
+            val = val[prop]
+        elif isinstance(val, list) and prop.isdigit() and int(prop) < len(val):
+            val = val[int(prop)]
+        else:
+            raise Exception(f"Property not exist: {prop}")
+    return val
+
 # 解析pandas df字段表达式
 def parse_df_props(expr):
     # 获得df变量
@@ -381,12 +555,17 @@ sys_funcs = {
     'link': link,
     'link_sheet': link_sheet,
     'read_file': read_file,
-    'read_json': read_json,
-    'read_yaml': read_yaml,
-    'read_env': read_env,
-    'read_properties': read_properties,
+    # 读文件并解析的函数有缓存, 可调用 use_file_cache(False) 来禁用缓存
+    'read_json': read_json_cached,
+    'read_yaml': read_yaml_cached,
+    'read_env': read_env_cached,
+    'read_properties': read_properties_cached,
+    'read_csv': read_csv_cached,
+    # 逐行读文件的生成器, 用于for循环大文件, 每次只有一行(块)数据在内存中
+    'iter_csv': iter_csv_rows,
+    'iter_jsonl': iter_jsonl,
     'render_text': lambda txt: render_text(txt, get_vars()), # 取 set_vars()设置的变量作为模板参数
-    'render_file': lambda file: render_file(file, get_vars()),
+    'render_file': lambda file: render_file_cached(file, get_vars()),
 }
 # 自定义函数, 通过 -c 注入的外部python文件定义的函数
 custom_funs = {}
@@ -449,6 +628,162 @@ def call_func(name, params):
     # 调用函数
     return func(*params)
 
+# -------------------- python表达式的执行 ----------------------
+# 用在 if/break_if/moveon_if 动作的条件, 以及抽取器的eval类型
+# 编译后的代码有缓存, 简单表达式(如比较/逻辑运算)则直接遍历语法树来求值, 不用eval
+
+# 简单表达式支持的运算符
+simple_expr_ops = {
+    # 比较
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+    # 算术
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    # 一元
+    ast.Not: operator.not_,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+# 编译python表达式, 有缓存
+@lru_cache(maxsize=var_template_cache_size)
+def compile_expr(expr):
+    return compile(expr, '<expr>', 'eval')
+
+# 编译python表达式为求值函数, 有缓存
+# :return 求值函数, 参数是(globals, locals)
+@lru_cache(maxsize=var_template_cache_size)
+def compile_expr_evaluator(expr, simple = True):
+    # 简单表达式: 遍历语法树来求值
+    if simple:
+        try:
+            evaluator = compile_simple_expr(ast.parse(expr.strip(), mode='eval').body)
+        except SyntaxError:
+            evaluator = None
+        if evaluator is not None:
+            return evaluator
+
+    # 复杂表达式: eval编译后的代码
+    code = compile_expr(expr)
+    return lambda globals, locals: eval(code, globals, locals)
+
+# 执行python表达式
+# :param expr 表达式
+# :param globals 全局变量
+# :param locals 本地变量, 一般是 get_vars()
+# :param simple 是否对简单表达式(如比较/逻辑运算)直接遍历语法树来求值, 不用eval
+def eval_expr(expr, globals, locals, simple = True):
+    return compile_expr_evaluator(expr, simple)(globals, locals)
+
+# 编译简单表达式的语法树节点为求值函数
+# :return 求值函数, 参数是(globals, locals); 如果不是简单表达式则返回None
+def compile_simple_expr(node):
+    # 常量
+    if isinstance(node, ast.Constant):
+        val = node.value
+        return lambda g, l: val
+
+    # 变量: 跟eval一样, 按 本地变量->全局变量->内置变量 的顺序查找
+    if isinstance(node, ast.Name):
+        name = node.id
+        def load(g, l):
+            try:
+                return l[name]
+            except KeyError:
+                pass
+            try:
+                return g[name]
+            except KeyError:
+                pass
+            try:
+                return getattr(builtins, name)
+            except AttributeError:
+                raise NameError(f"name '{name}' is not defined")
+        return load
+
+    # 比较: 支持链式比较, 如 1 < a < 3
+    if isinstance(node, ast.Compare):
+        left = compile_simple_expr(node.left)
+        rights = [compile_simple_expr(right) for right in node.comparators]
+        ops = [simple_expr_ops.get(type(op)) for op in node.ops]
+        if left is None or None in rights or None in ops:
+            return None
+        if len(ops) == 1: # 单个比较, 直接返回结果, 兼容pandas等返回非bool的比较
+            op, right = ops[0], rights[0]
+            return lambda g, l: op(left(g, l), right(g, l))
+        def compare(g, l):
+            a = left(g, l)
+            for op, right in zip(ops, rights):
+                b = right(g, l)
+                ret = op(a, b)
+                if not ret:
+                    return ret
+                a = b
+            return ret
+        return compare
+
+    # 逻辑运算: and/or, 跟python一样短路求值
+    if isinstance(node, ast.BoolOp):
+        values = [compile_simple_expr(value) for value in node.values]
+        if None in values:
+            return None
+        is_and = isinstance(node.op, ast.And)
+        def bool_op(g, l):
+            for value in values:
+                ret = value(g, l)
+                if is_and != bool(ret):
+                    return ret
+            return ret
+        return bool_op
+
+    # 一元运算: not/-/+
+    if isinstance(node, ast.UnaryOp):
+        op = simple_expr_ops.get(type(node.op))
+        operand = compile_simple_expr(node.operand)
+        if op is None or operand is None:
+            return None
+        return lambda g, l: op(operand(g, l))
+
+    # 算术运算
+    if isinstance(node, ast.BinOp):
+        op = simple_expr_ops.get(type(node.op))
+        left = compile_simple_expr(node.left)
+        right = compile_simple_expr(node.right)
+        if op is None or left is None or right is None:
+            return None
+        return lambda g, l: op(left(g, l), right(g, l))
+
+    # 属性, 如 response.status_code
+    if isinstance(node, ast.Attribute):
+        obj = compile_simple_expr(node.value)
+        if obj is None:
+            return None
+        attr = node.attr
+        return lambda g, l: getattr(obj(g, l), attr)
+
+    # 下标, 如 data['msg']
+    if isinstance(node, ast.Subscript):
+        obj = compile_simple_expr(node.value)
+        key = compile_simple_expr(node.slice)
+        if obj is None or key is None:
+            return None
+        return lambda g, l: obj(g, l)[key(g, l)]
+
+    return None
+
 # -------------------- pandas扩展 ----------------------
 # 任意值转df
 def val2df(val):
@@ -50,7 +50,7 @@ class VarParser(object):
         self.vars |= vars
         log.debug(f"解析[%s]用到的变量: %s", step_file, vars)
         # 解析设置的变量
-        steps = yaml.load(txt, Loader=yaml.FullLoader)
+        steps = yaml.load(txt, Loader=YamlLoader)
         vars_set = self.parse_vars_set(steps)
         self.vars_set |= vars_set
         log.debug(f"解析[%s]设置的变量: %s", step_file, vars_set)
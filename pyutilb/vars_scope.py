@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+分层的变量作用域, 类似 ChainMap
+    本层只存放本层写过的变量(即脏变量), 读不到时再读上一层, 因此入栈时不用复制上一层的全部变量, 出栈回写时也只需回写脏变量
+    继承dict, 以便兼容 eval()/jsonpath 等要求dict类型的调用方
+'''
+class VarsScope(dict):
+
+    def __init__(self, parent = None):
+        super().__init__()
+        self.parent = parent # 上一层
+        self.deleted = set() # 本层删除的变量, 用来屏蔽上一层的同名变量
+
+    # 本层读不到, 则读上一层
+    def __missing__(self, key):
+        if self.parent is None or key in self.deleted:
+            raise KeyError(key)
+        return self.parent[key]
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        return self.parent is not None and key not in self.deleted and key in self.parent
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default = None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def __delitem__(self, key):
+        found = dict.__contains__(self, key)
+        if found:
+            dict.__delitem__(self, key)
+        # 屏蔽上一层的同名变量
+        if self.parent is not None and key not in self.deleted and key in self.parent:
+            self.deleted.add(key)
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        val = self[key]
+        del self[key]
+        return val
+
+    # 清空: 连同上一层的变量也屏蔽掉
+    def clear(self):
+        dict.clear(self)
+        self.parent = None
+        self.deleted = set()
+
+    # 合并上一层的变量, 转为普通dict
+    def flatten(self):
+        if self.parent is None:
+            return dict(dict.items(self))
+        ret = self.parent.flatten()
+        for key in self.deleted:
+            ret.pop(key, None)
+        ret.update(dict.items(self))
+        return ret
+
+    # 复制, 返回普通dict
+    def copy(self):
+        return self.flatten()
+
+    # 本层写过的变量
+    def dirty_items(self):
+        return dict.items(self)
+
+    def keys(self):
+        return self.flatten().keys()
+
+    def values(self):
+        return self.flatten().values()
+
+    def items(self):
+        return self.flatten().items()
+
+    def __iter__(self):
+        return iter(self.flatten())
+
+    def __len__(self):
+        return len(self.flatten())
+
+    def __eq__(self, other):
+        if isinstance(other, VarsScope):
+            other = other.flatten()
+        return self.flatten() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.flatten())
+
+    # 序列化为普通dict
+    def __reduce__(self):
+        return (dict, (self.flatten(),))
+
+if __name__ == '__main__':
+    root = VarsScope()
+    root['a'] = 1
+    root['b'] = 2
+    child = VarsScope(root)
+    child['a'] = 3
+    del child['b']
+    print(child, dict(child.dirty_items()), root)
@@ -2,19 +2,63 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import fnmatch
+import inspect
+import multiprocessing
+import sys
 import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-from pyutilb.cmd import run_command
-from pyutilb.log import log
+from pyutilb import cmd
+from pyutilb.cmd import run_command, get_cmd_option, apply_cmd_option
+from pyutilb.log import log, AsyncLogger
 from pyutilb.util import *
 from pyutilb.file import *
+from pyutilb.file_async import run_in_file_executor
 from pyutilb.stat import Stat
+from pyutilb.metrics import metrics_exporter
+from pyutilb.tracer import Tracer
+from pyutilb.profiler import Profiler
+from pyutilb.threadlocal import ThreadLocal
+from pyutilb.vars_scope import VarsScope
 
 # 跳出循环的异常
 class BreakException(Exception):
     def __init__(self, condition):
         self.condition = condition # 跳转条件
 
+# 编译后的步骤列表
+# 依然是list(元素是原始的步骤dict), 以便兼容直接遍历步骤的子类; 同时挂上执行计划, 在第一次执行时才编译
+class CompiledSteps(list):
+
+    def __init__(self, steps):
+        super().__init__(steps)
+        self.plan = None # 执行计划: StepPlan的列表
+        self.includes = None # 步骤文件中静态的include文件名, 用于预取
+
+# 输出yaml时当作普通list
+yaml.add_representer(CompiledSteps, yaml.representer.SafeRepresenter.represent_list)
+
+# 单个步骤的执行计划
+class StepPlan(object):
+    __slots__ = ('actions', 'error')
+
+    def __init__(self, actions, error = None):
+        self.actions = actions # ActionPlan的列表
+        self.error = error # 编译时的异常, 如else位置不对, 执行到该步骤时才抛出
+
+# 单个动作的执行计划
+# 不记录参数中是否有变量: 变量替换是在各动作函数内部做的, 计划无从跳过; 且不带$的字符串参数在 replace_var() 中已直接返回
+class ActionPlan(object):
+    __slots__ = ('action', 'name', 'args', 'param', 'error')
+
+    def __init__(self, action, param):
+        self.action = action # 原始动作名, 如 for(3)
+        self.name = None # 解析后的动作名, 如 for
+        self.args = [] # 解析后的动作参数, 如 ['3']
+        self.param = param # 参数, 如果是子步骤则已编译
+        self.error = None # 编译时的异常, 如动作名语法错误, 执行到该动作时才抛出
+
 # 基于yaml的启动器
 class YamlBoot(object):
 
@@ -27,6 +71,12 @@ class YamlBoot(object):
         self.step_file = None
         # 步骤文的缓存, 用于减少文件读IO, 如果你想读文件缓存, 请调用use_file_cache(True), 如LocustBoot压测时可能会频繁include步骤文件
         self.step_file_cache = None
+        # 是否持久化缓存步骤文件的解析结果, 供后续运行或其他进程复用, 可通过命令行选项 --step-cache 或调用use_persist_cache(True)来启用
+        self.step_persist_cache = bool(get_cmd_option('step_cache', False))
+        # 预取include的http步骤文件的线程数, 为0则不预取; 启用步骤文件缓存时预取的结果放到缓存中, 否则放到 prefetched_steps 中
+        self.prefetch_workers = 8
+        # 未启用步骤文件缓存时, 预取的步骤: 步骤文件 => 步骤, 执行到include动作时取出(只用一次)
+        self.prefetched_steps = {}
         # 动作映射函数
         self.actions = {
             'exit': exit,
@@ -35,6 +85,8 @@ class YamlBoot(object):
             'print': self.print,
             'log_level': self.log_level,
             'for': self.do_for,
+            'for_parallel': self.for_parallel,
+            'for_parallel_process': self.for_parallel_process,
             'if': self.do_if,
             'else': self.do_else,
             'once': self.once,
@@ -47,22 +99,64 @@ class YamlBoot(object):
             'proc': self.proc,
             'call': self.call,
         }
+        self.init_async_actions() # 异步执行时用到的动作
         set_var('boot', self)
         # 记录定义的过程, 通过 ~过程名 来定义, 通过 call:过程名 来调用
         self.procs = {}
         # 统计
         self.stat = Stat.start()
+        self.local_stats = ThreadLocal() # 并行迭代时, 各线程用自己的统计, 最后再合并
         self.stat_dump = True # 是否需要输出统计结果到stat.yml，K8sBoot/SparkBoot项目不需要
         # 调试
         self.debug = False
+        # 跟踪器, 调用 enable_trace() 才启用
+        self.tracer = None
+        # 性能分析器, 调用 enable_profile() 才启用
+        self.profiler = None
+
+    # 统计: 并行迭代中则用当前线程的统计
+    @property
+    def stat(self):
+        stat = self.local_stats.get()
+        if stat is None:
+            return self._stat
+        return stat
+
+    @stat.setter
+    def stat(self, stat):
+        self._stat = stat
 
     # 设置是否使用文件缓存, 一般用在LocustBoot, 其压测时可能会频繁include步骤文件
-    def use_file_cache(self, cached):
+    # 缓存有大小限制(LRU), 本地文件修改后自动失效, http文件则缓存后不再请求
+    # :param cached 是否缓存
+    # :param maxsize 最多缓存的文件数
+    def use_file_cache(self, cached, maxsize = 512):
         if cached:
-            self.step_file_cache = {}
+            # 不复制缓存的步骤: 步骤只读不改, 且其执行计划要挂在缓存的步骤上才能复用
+            self.step_file_cache = FileCache(maxsize, revalidate_http = False, copy = False)
         else:
             self.step_file_cache = None
 
+    # 设置是否持久化缓存步骤文件的解析结果: 缓存到当前用户的缓存目录(默认 ~/.cache/pyutilb/yamlcache)中, 供后续运行或其他进程(如locust的worker)复用
+    def use_persist_cache(self, cached):
+        self.step_persist_cache = cached
+
+    # 启用跟踪: 记录yaml文件/步骤/动作的执行区间, 执行结束后输出为 Chrome Trace Event 格式的json文件
+    # 要在执行前调用, 未启用时没有任何开销
+    def enable_trace(self, file = 'trace.json'):
+        if self.tracer is None:
+            self.tracer = Tracer(file).install(self)
+        return self.tracer
+
+    # 启用性能分析: 用 cProfile/tracemalloc 包装 run() 的执行, 执行结束后输出报告
+    # :param cpu_file cpu分析的pstats文件, 为None则不做cpu分析
+    # :param mem_file 内存分析的报告文件, 为None则不做内存分析
+    # :param top 报告中输出前几名
+    def enable_profile(self, cpu_file = None, mem_file = None, top = 20):
+        if self.profiler is None:
+            self.profiler = Profiler(cpu_file, mem_file, top).install(self)
+        return self.profiler
+
     # 添加单个动作
     def add_action(self, name: str, callback: str):
         self.actions[name] = callback
@@ -81,7 +175,35 @@ class YamlBoot(object):
     :param throwing 是否直接抛异常
     '''
     def run(self, step_files, throwing = True):
+        # 命令行指定了指标端口, 则启动指标导出器
+        metrics_port = get_cmd_option('metrics_port')
+        if metrics_port:
+            metrics_exporter.add_stat(self, type(self).__name__).start(metrics_port, get_cmd_option('metrics_host', '127.0.0.1'))
+
+        trace_file = get_cmd_option('trace')
+        cpu_file = get_cmd_option('profile')
+        mem_file = get_cmd_option('tracemalloc')
+
+        # 命令行指定了多进程, 则分片执行: 跟踪与性能分析只作用于当前进程, 而步骤都在子进程中执行, 因此不支持同时指定
+        workers = get_cmd_option('workers')
+        if workers is not None and workers > 1:
+            if trace_file or cpu_file or mem_file:
+                raise Exception("Option --workers cannot be combined with --trace/--profile/--tracemalloc")
+            return self.run_sharded(step_files, workers, throwing)
+
+        # 命令行指定了跟踪文件, 则启用跟踪
+        if trace_file:
+            self.enable_trace(trace_file)
+
+        # 命令行指定了性能分析文件, 则启用性能分析
+        if cpu_file or mem_file:
+            self.enable_profile(cpu_file, mem_file, get_cmd_option('profile_top', 20))
+
         try:
+            # 开始性能分析
+            if self.profiler is not None:
+                self.profiler.start()
+
             # 真正的执行
             self.do_run(step_files)
 
@@ -95,6 +217,13 @@ class YamlBoot(object):
                 self.stat.end(ex)
             if throwing:
                 raise ex
+        finally:
+            # 输出跟踪文件
+            if self.tracer is not None:
+                self.tracer.dump()
+            # 结束性能分析, 并输出报告
+            if self.profiler is not None:
+                self.profiler.stop()
 
     '''
     真正的执行入口
@@ -108,7 +237,7 @@ class YamlBoot(object):
                 if not os.path.exists(dir):
                     raise Exception(f'Step config directory not exist: {dir}')
                 self.run_1dir(dir, pattern)
-                return
+                continue
 
             # 2 不存在
             if (not is_http_file(path)) and not os.path.exists(path):
@@ -117,11 +246,56 @@ class YamlBoot(object):
             # 3 目录: 遍历执行子文件
             if os.path.isdir(path):
                 self.run_1dir(path)
-                return
+                continue
 
             # 4 纯文件
             self.run_1file(path)
 
+    '''
+    多进程分片执行: 将多个目录/模式/文件下的步骤文件分片到进程池中执行, 最后合并统计并输出到stat.yml
+    子进程是全新的进程, 会根据命令选项来初始化自己的变量与自定义函数, 并创建自己的boot(要求boot类的构造函数无参数)
+    :param step_files 步骤配置文件或目录的列表
+    :param workers 进程数, 默认为cpu数
+    :param throwing 是否直接抛异常
+    '''
+    def run_sharded(self, step_files, workers = None, throwing = True):
+        try:
+            # 真正的执行
+            self.do_run_sharded(step_files, workers)
+
+            self.on_end() # 执行完的后置处理, 要在统计扫尾前调用
+
+            if self.stat_dump:
+                self.stat.end()
+            return self.stat
+        except Exception as ex:
+            if self.stat_dump:
+                self.stat.end(ex)
+            if throwing:
+                raise ex
+
+    # 真正的多进程分片执行
+    def do_run_sharded(self, step_files, workers = None):
+        # 将文件按轮询分片
+        files = [os.path.abspath(file) if not is_http_file(file) else file for file in self.iterate_step_files(step_files)]
+        if not files:
+            return
+        workers = min(self.parse_workers(workers), len(files))
+        shards = [files[i::workers] for i in range(workers)]
+        log.debug(f"Run %s step files in %s shards", len(files), workers)
+
+        # 子进程用spawn方式创建, 以便拥有全新的变量与自定义函数
+        errors = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(run_shard, type(self), shard, cmd.cmd_option) for shard in shards]
+            for future in futures:
+                stat = future.result()
+                self.stat.merge(stat)
+                if stat.err is not None:
+                    errors.append(stat.err)
+        if errors:
+            raise Exception("分片执行出错: " + '; '.join(errors))
+
     # 执行单个步骤目录: 遍历执行子文件
     # :param path 目录
     # :param pattern 文件名模式
@@ -166,8 +340,7 @@ class YamlBoot(object):
     def load_1file(self, step_file, include):
         # 获得步骤文件的绝对路径
         if include:  # 补上绝对路径
-            if (not is_http_file(step_file)) and not os.path.isabs(step_file):
-                step_file = self.step_dir + os.sep + step_file
+            step_file = self.get_include_file(step_file)
         else:  # 记录目录
             if is_http_file(step_file):
                 i = step_file.rindex('/')
@@ -178,37 +351,152 @@ class YamlBoot(object):
         # 记录步骤文件
         self.step_file = step_file
         # 读取步骤
-        return self.read_cached_step_file(step_file)
+        steps = self.read_cached_step_file(step_file)
+        # 预取include的文件
+        if not include:
+            self.prefetch_includes(steps)
+        return steps
+
+    # 获得include的文件的绝对路径
+    def get_include_file(self, step_file):
+        if (not is_http_file(step_file)) and not os.path.isabs(step_file):
+            return self.step_dir + os.sep + step_file
+        return step_file
+
+    # 预取include的文件: 在线程池中并发读取并解析静态的include文件(文件名不带变量), 并递归预取其include的文件
+    # 结果放到步骤文件缓存中, 未启用缓存则放到 prefetched_steps 中
+    # 只预取http步骤文件(根步骤文件可以是本地文件), 免得执行到include动作时才逐个串行请求; 本地文件读取很快, 不用预取
+    def prefetch_includes(self, steps):
+        self.prefetched_steps = {}
+        if not self.prefetch_workers:
+            return
+        files = self.get_prefetch_files(steps)
+        if not files:
+            return
+
+        seen = set(files)
+        with ThreadPoolExecutor(max_workers=self.prefetch_workers) as pool:
+            futures = {pool.submit(self.read_cached_step_file, file): file for file in files}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = futures.pop(future)
+                    try:
+                        steps = future.result()
+                    except Exception as ex: # 预取失败, 则执行到include动作时再读, 届时再抛异常
+                        log.debug("Fail to prefetch step file: %s", ex)
+                        continue
+                    if self.step_file_cache is None:
+                        self.prefetched_steps[file] = steps
+                    # 递归预取
+                    for file in self.get_prefetch_files(steps):
+                        if file not in seen:
+                            seen.add(file)
+                            futures[pool.submit(self.read_cached_step_file, file)] = file
+        log.debug("Prefetch step files: %s", seen)
 
-    # 有缓存的读步骤文件
+    # 获得要预取的include的http文件
+    def get_prefetch_files(self, steps):
+        includes = getattr(steps, 'includes', None)
+        if not includes:
+            return []
+        files = []
+        for file in includes:
+            if '$' in file: # 带变量的文件名, 执行时才能确定
+                continue
+            file = self.get_include_file(file)
+            if is_http_file(file):
+                files.append(file)
+        return files
+
+    # 有缓存的读步骤文件, 读到的步骤会被编译, 并跟文件一起缓存
     def read_cached_step_file(self, step_file):
-        # 无缓存: 直接读文件
+        # 无缓存: 有预取的则用预取的, 否则直接读文件
         if self.step_file_cache is None:
-            return read_yaml(step_file)
+            steps = self.prefetched_steps.pop(step_file, None)
+            if steps is not None:
+                return steps
+            return self.read_step_file(step_file)
 
         # 有缓存: 读缓存
-        if step_file not in self.step_file_cache:
-            self.step_file_cache[step_file] = read_yaml(step_file)
-        return self.step_file_cache[step_file]
+        return self.step_file_cache.read(step_file, parse=self.parse_step_file, load=self.read_step_file)
 
-    # 执行多个步骤
-    def run_steps(self, steps):
-        # 逐个步骤调用多个动作
+    # 读步骤文件并编译
+    def read_step_file(self, step_file):
+        if self.step_persist_cache:
+            steps = read_yaml_persist_cached(step_file)
+        else:
+            steps = read_yaml(step_file)
+        return self.compile_step_file(steps)
+
+    # 解析步骤文件内容并编译, 用于http步骤文件
+    def parse_step_file(self, txt):
+        return self.compile_step_file(parse_yaml(txt))
+
+    # 编译步骤文件的步骤, 并记录其中静态的include文件名, 用于预取
+    def compile_step_file(self, steps):
+        steps = self.compile_steps(steps)
+        if steps is not None:
+            steps.includes = self.collect_includes(steps)
+        return steps
+
+    # 收集步骤(含for/if等动作的子步骤)中include的文件名
+    def collect_includes(self, steps, includes = None):
+        if includes is None:
+            includes = set()
         for step in steps:
-            self.stat.incr_step()  # 统计
+            if not isinstance(step, dict):
+                continue
             for action, param in step.items():
+                if action == 'include' and isinstance(param, str):
+                    includes.add(param.strip())
+                elif isinstance(param, list):
+                    self.collect_includes(param, includes)
+        return includes
+
+    # 编译多个步骤: 包装为 CompiledSteps, 执行计划在第一次执行时才生成
+    def compile_steps(self, steps):
+        if steps is None or isinstance(steps, CompiledSteps):
+            return steps
+        return CompiledSteps(steps)
+
+    # 获得多个步骤的执行计划
+    def get_steps_plan(self, steps):
+        # 未编译的步骤(如子类直接传入的list): 即时生成执行计划, 不缓存
+        if not isinstance(steps, CompiledSteps):
+            return self.compile_plan(steps)
+
+        if steps.plan is None:
+            steps.plan = self.compile_plan(steps)
+        return steps.plan
+
+    # 生成多个步骤的执行计划: 预先校验if/else位置、解析动作名与参数; 动作函数则在执行时才按动作名查找
+    def compile_plan(self, steps):
+        plan = []
+        for step in steps:
+            error = None
+            try:
                 self.check_if_else_pos(step)
-                self.stat.incr_action()  # 统计
-                self.run_action(action, param)
+            except Exception as ex:
+                error = ex
+            actions = [self.compile_action(action, param) for action, param in step.items()]
+            plan.append(StepPlan(actions, error))
+        return plan
 
-    '''
-    执行单个动作：就是调用动作名对应的函数
-    :param action 动作名
-    :param param 参数
-    :return 有返回值，以便处理协程方法
-    '''
-    def run_action(self, action, param):
-        log.debug(f"handle action: %s=%s", action, param)
+    # 生成单个动作的执行计划
+    def compile_action(self, action, param):
+        # 子步骤(如for/if/proc动作的参数)也要编译
+        if isinstance(param, list) and param and all(isinstance(step, dict) for step in param):
+            param = self.compile_steps(param)
+        ap = ActionPlan(action, param)
+        try:
+            ap.name, ap.args = self.parse_action(action)
+        except Exception as ex:
+            ap.error = ex
+        return ap
+
+    # 解析动作名与参数, 如 for(3) 解析为 for 与 ['3']
+    def parse_action(self, action):
         if action[0] == '~':  # 定义过程
             action = f"proc({action[1:]})"
 
@@ -216,12 +504,67 @@ class YamlBoot(object):
         args = []
         if '(' in action:
             action, args = parse_func(action)
+        return action, args
+
+    # 执行多个步骤
+    def run_steps(self, steps):
+        # 子类改写了run_action(), 则逐个动作调用run_action()
+        stat = self.stat
+        if type(self).run_action is not YamlBoot.run_action:
+            for step in steps:
+                stat.incr_step()  # 统计
+                self.check_if_else_pos(step)
+                for action, param in step.items():
+                    stat.incr_action()  # 统计
+                    start = time.perf_counter()
+                    try:
+                        self.run_action(action, param)
+                    finally:
+                        stat.record_action(action.split('(', 1)[0], time.perf_counter() - start)  # 统计耗时
+            return
+
+        # 逐个步骤执行计划
+        for step in self.get_steps_plan(steps):
+            stat.incr_step()  # 统计
+            if step.error is not None:
+                raise step.error
+            for ap in step.actions:
+                stat.incr_action()  # 统计
+                start = time.perf_counter()
+                try:
+                    self.run_action_plan(ap)
+                finally:
+                    stat.record_action(ap.name or ap.action, time.perf_counter() - start)  # 统计耗时
+
+    # 执行单个动作的计划
+    def run_action_plan(self, ap):
+        log.debug(f"handle action: %s=%s", ap.action, ap.param)
+        if ap.error is not None:
+            raise ap.error
 
+        # 执行时才按动作名找函数: 计划可能被多个启动器共享, 且动作可能被后来的 add_action() 改写
+        func = self.get_action_func(ap.name)
+        return func(ap.param, *ap.args)
+
+    # 获得动作对应的函数
+    def get_action_func(self, action):
         if action not in self.actions:
             raise Exception(f'Invalid action: [{action}]')
+        return self.actions[action]
+
+    '''
+    执行单个动作：就是调用动作名对应的函数
+    :param action 动作名
+    :param param 参数
+    :return 有返回值，以便处理协程方法
+    '''
+    def run_action(self, action, param):
+        log.debug(f"handle action: %s=%s", action, param)
+        # 解析动作名与参数
+        action, args = self.parse_action(action)
 
         # 调用动作对应的函数
-        func = self.actions[action]
+        func = self.get_action_func(action)
         return func(param, *args)
 
     # --------- 动作处理的函数 --------
@@ -245,24 +588,43 @@ class YamlBoot(object):
             start, end, _ = parse_range(n)
             return range(start, end + 1)
 
-        # 3 变量表达式, 必须是int/list/df.Series类型
+        # 3 变量表达式, 必须是int/list/pd.Series类型, 或可惰性迭代的对象
         expr = "${" + n + "}"
         n = replace_var(expr, False)
 
         # fix bug: pd.Series is None 居然返回pd.Series
-        if self.is_pd_series(n):
+        if self.is_pd_series(n) or self.is_lazy_items(n):
             return n
         if n is None or not (isinstance(n, (list, tuple, set, range, int))):
-            raise Exception(f'Variable in for({n}) parentheses must be int/list/tuple/set/range/pd.Series type')
+            raise Exception(f'Variable in for({n}) parentheses must be int/list/tuple/set/range/pd.Series/pd.DataFrame/SparkDfProxy type, or an iterator')
         return n
 
     # 判断是否是pd.Series, 但不是所有boot项目都依赖pandas
+    # pandas未导入则不可能是pd.Series, 不用为了判断而导入pandas
     def is_pd_series(self, n):
-        try:
-            import pandas as pd
-            return isinstance(n, pd.Series)
-        except ImportError:
-            return False
+        pd = sys.modules.get('pandas')
+        return pd is not None and isinstance(n, pd.Series)
+
+    # 判断是否是可惰性迭代的对象: 迭代器(如生成器/pandas分块读csv的reader)/pd.DataFrame/SparkDfProxy/spark DataFrame
+    # 迭代时每次只取一个元素, 不用全部加载到内存中
+    def is_lazy_items(self, n):
+        if isinstance(n, (Iterator, SparkDfProxy)) or hasattr(n, 'toLocalIterator'):
+            return True
+        pd = sys.modules.get('pandas')
+        return pd is not None and isinstance(n, pd.DataFrame)
+
+    # 惰性迭代循环的列表值
+    # :return 迭代器: DataFrame/分块读csv的reader的元素是行dict, spark DataFrame的元素是Row, 其他则是原元素
+    def iter_items(self, items):
+        pd = sys.modules.get('pandas')
+        if pd is not None:
+            if isinstance(items, pd.DataFrame):
+                return iter_df_rows(items)
+            if isinstance(items, pd.io.parsers.TextFileReader): # 分块读csv的reader, 逐块逐行迭代
+                return (row for chunk in items for row in iter_df_rows(chunk))
+        if hasattr(items, 'toLocalIterator'): # spark DataFrame: 逐个分区拉取数据
+            return items.toLocalIterator()
+        return iter(items)
 
     # 执行一次的几率
     # 一般用在 LocustBoot 中控制多接口用例的吞吐量比例
@@ -277,35 +639,37 @@ class YamlBoot(object):
         if random.randint(1, 100) <= percent:
             self.run_steps(steps)
 
-    # for循环
-    # :param steps 每个迭代中要执行的步骤
+    # 解析for循环
     # :param n 循环次数/循环列表变量名
-    def do_for(self, steps, n = None):
+    # :return 循环标签 + 迭代器, 迭代元素为(下标, 元素)
+    def parse_for(self, n):
         n = self.parse_for_n(n)
-        label = f"for({n})"
+        # 循环的列表值: 惰性迭代, 不按下标取元素, 以便支持迭代器, 也免得pd.Series每次按下标取值
+        if self.is_lazy_items(n):
+            return f"for({type(n).__name__})", enumerate(self.iter_items(n))
+        if isinstance(n, (list, tuple, set, range)) or self.is_pd_series(n):
+            return f"for({n})", enumerate(n)
+
         # 循环次数
-        # fix bug: pd.Series == None 居然返回pd.Series
-        n_null = (not self.is_pd_series(n)) and n is None
-        if n_null:
+        label = f"for({n})"
+        if n is None:
             n = sys.maxsize # 最大int，等于无限循环次数
             label = f"for(∞)"
-        # 循环的列表值
-        items = None
-        if isinstance(n, (list, tuple, set, range)) or self.is_pd_series(n):
-            items = n
-            n = len(items)
+        return label, ((i, None) for i in range(n))
+
+    # for循环
+    # :param steps 每个迭代中要执行的步骤
+    # :param n 循环次数/循环列表变量名
+    def do_for(self, steps, n = None):
+        label, iterations = self.parse_for(n)
         log.debug(f"-- Loop start: %s -- ", label)
         last_i = get_var('for_i', False) # 旧的索引
         last_v = get_var('for_v', False) # 旧的元素
         try:
-            for i in range(n):
+            for i, v in iterations:
                 # i+1表示迭代次数比较容易理解
                 log.debug(f"%sth iteration", i+1)
                 set_var('for_i', i+1) # 更新索引
-                if n_null or items is None:
-                    v = None
-                else:
-                    v = items[i]
                 set_var('for_v', v) # 更新元素
                 self.run_steps(steps)
         except BreakException as e:  # 跳出循环
@@ -316,6 +680,122 @@ class YamlBoot(object):
             set_var('for_i', last_i) # 恢复索引
             set_var('for_v', last_v) # 恢复元素
 
+    # 解析并行数, 默认为cpu数
+    def parse_workers(self, workers):
+        if workers is None or workers == '':
+            return os.cpu_count() or 1
+        return int(replace_var(workers))
+
+    # 并行的for循环: 在线程池中并行执行各次迭代, 适用于迭代间互不依赖的场景, 如每行csv调用一次接口
+    # 每次迭代有独立的变量作用域(读不到的变量再读父作用域), 其中设置的变量(包括for_i/for_v)不会回写
+    # :param steps 每个迭代中要执行的步骤
+    # :param n 循环次数/循环列表变量名
+    # :param workers 并行数, 默认为cpu数
+    def for_parallel(self, steps, n = None, workers = None):
+        workers = self.parse_workers(workers)
+        parent_vars = get_vars()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            submit = lambda i, v: executor.submit(self.run_iteration, steps, parent_vars, i, v)
+            self.run_parallel(n, workers, submit)
+
+    # 多进程的for循环: 在进程池中并行执行各次迭代, 适用于cpu密集的场景
+    # 子进程是fork出来的, 因此能直接使用父进程的变量与自定义函数, 但子进程中设置的变量不会回写
+    # :param steps 每个迭代中要执行的步骤
+    # :param n 循环次数/循环列表变量名
+    # :param workers 并行数, 默认为cpu数
+    def for_parallel_process(self, steps, n = None, workers = None):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise Exception("for_parallel_process动作只支持能fork进程的系统, 请改用for_parallel动作")
+        workers = self.parse_workers(workers)
+        global fork_context
+        fork_context = (self, steps, get_vars())
+        # fork时如果日志线程正在写日志, 子进程继承的锁可能一直被持有, 因此先等积压的日志都输出
+        # 子进程中的日志线程池/追加写器/文件io线程池会在fork后重建(见 os.register_at_fork() 的注册); 而定时器/指标导出等线程在子进程中不存在, 迭代中不要依赖它们
+        AsyncLogger.flush()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                submit = lambda i, v: executor.submit(run_forked_iteration, i, v)
+                self.run_parallel(n, workers, submit)
+        finally:
+            fork_context = None
+
+    '''
+    并行执行各次迭代
+    :param n 循环次数/循环列表变量名
+    :param workers 并行数
+    :param submit 提交单次迭代的函数, 参数是(下标, 元素), 返回future, future结果是(统计, 跳出循环的条件)
+    '''
+    def run_parallel(self, n, workers, submit):
+        label, iterations = self.parse_for(n)
+        log.debug(f"-- Parallel loop start: %s, workers: %s -- ", label, workers)
+        futures = set()
+        broken = None # 跳出循环的条件
+        try:
+            for i, v in iterations:
+                # 限制未完成的迭代数, 以便支持无限循环, 并及时响应break
+                while len(futures) >= workers * 2 and broken is None:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    broken = self.merge_parallel_results(done, broken)
+                if broken is not None:
+                    break
+                log.debug(f"%sth iteration", i + 1)
+                futures.add(submit(i, v))
+        except BaseException:
+            # 异常: 取消未开始的迭代
+            self.cancel_futures(futures)
+            raise
+
+        # 跳出循环: 取消未开始的迭代
+        if broken is not None:
+            self.cancel_futures(futures)
+        done, _ = wait(futures)
+        broken = self.merge_parallel_results([f for f in done if not f.cancelled()], broken)
+
+        if broken is not None:
+            log.debug(f"-- Parallel loop break: %s, break condition: %s -- ", label, broken)
+        else:
+            log.debug(f"-- Parallel loop finish: %s -- ", label)
+
+    # 取消未开始的迭代, 并等待已开始的迭代结束
+    def cancel_futures(self, futures):
+        for future in futures:
+            future.cancel()
+        wait(futures)
+
+    # 合并并行迭代的结果: 合并统计, 并返回跳出循环的条件
+    def merge_parallel_results(self, futures, broken):
+        error = None
+        for future in futures:
+            try:
+                stat, condition = future.result()
+            except Exception as ex:
+                error = ex
+                continue
+            self.stat.merge(stat)
+            if condition is not None and broken is None:
+                broken = condition
+        if error is not None:
+            raise error
+        return broken
+
+    # 执行单次迭代: 用独立的变量作用域与统计
+    # :return (统计, 跳出循环的条件)
+    def run_iteration(self, steps, parent_vars, i, v):
+        stat = Stat()
+        stack = vars_stacks.get()
+        stack.append(VarsScope(parent_vars))
+        self.local_stats.set(stat)
+        try:
+            set_var('for_i', i + 1)
+            set_var('for_v', v)
+            self.run_steps(steps)
+            return stat, None
+        except BreakException as e:
+            return stat, e.condition
+        finally:
+            self.local_stats.set(None)
+            stack.pop()
+
     # 执行一次子步骤，相当于 for(1)
     def once(self, steps):
         self.do_for(steps, 1)
@@ -340,8 +820,7 @@ class YamlBoot(object):
         if 'if' in actions and 'else' in actions:
             keys = list(actions.keys())
             last_if = -2 # 记录前一个if位置
-            for i in keys:
-                key = keys[i]
+            for i, key in enumerate(keys):
                 if key == 'if':
                     last_if = i
                 elif key == 'else':
@@ -362,7 +841,7 @@ class YamlBoot(object):
 
     # 执行条件表达式
     def eval_condition(self, expr):
-        val = eval(expr, globals(), get_vars())  # 丢失本地与全局变量, 如引用不了json模块
+        val = eval_expr(expr, globals(), get_vars())  # 丢失本地与全局变量, 如引用不了json模块
         return bool(val)
 
     # 加载并执行其他步骤文件
@@ -385,8 +864,7 @@ class YamlBoot(object):
     # 睡眠
     def sleep(self, seconds):
         seconds = replace_var(seconds)  # 替换变量
-        time.sleep(int(seconds))
-        # await asyncio.sleep(int(seconds)) # 改为协程：整个调用栈都需要调整，当有迫切需求时才做
+        time.sleep(int(seconds)) # 异步执行请用 run_async(), 会改用 sleep_async()
 
     # 打印
     def print(self, msg):
@@ -420,4 +898,237 @@ class YamlBoot(object):
 
         # 执行多个步骤
         steps = self.procs[name]
-        self.run_steps(steps)
\ No newline at end of file
+        self.run_steps(steps)
+
+    # --------- 异步执行 --------
+    # 异步执行时, 以下动作用协程实现, 其他动作依然调用 self.actions 中的函数(可以是普通函数或协程函数)
+    # 这样多个场景(每个场景一个boot)可以共用一个 EventLoopThread
+    def init_async_actions(self):
+        self.async_actions = {
+            'sleep': self.sleep_async,
+            'exec': self.exec_async,
+            'include': self.include_async,
+            'for': self.do_for_async,
+            'once': self.once_async,
+            'if': self.do_if_async,
+            'else': self.do_else_async,
+            'call': self.call_async,
+        }
+
+    # 添加多个异步动作
+    def add_async_actions(self, actions: dict):
+        self.async_actions = {**self.async_actions, **actions}
+
+    '''
+    异步执行入口
+    :param step_files 步骤配置文件或目录的列表
+    :param throwing 是否直接抛异常
+    '''
+    async def run_async(self, step_files, throwing = True):
+        set_var('boot', self) # 每个asyncio任务有独立的变量
+        try:
+            # 真正的执行
+            for file in self.iterate_step_files(step_files):
+                await self.run_1file_async(file)
+
+            self.on_end() # 执行完的后置处理, 要在统计扫尾前调用
+
+            if self.stat_dump:
+                self.stat.end()
+            return self.stat
+        except Exception as ex:
+            if self.stat_dump:
+                self.stat.end(ex)
+            if throwing:
+                raise ex
+
+    # 遍历步骤文件, 目录或模式文件则遍历其匹配的子文件
+    # :param step_files 步骤配置文件或目录的列表
+    def iterate_step_files(self, step_files):
+        for path in step_files:
+            # 1 模式文件
+            if '*' in path:
+                dir, pattern = path.rsplit(os.sep, 1)  # 从后面分割，分割为目录+模式
+                if not os.path.exists(dir):
+                    raise Exception(f'Step config directory not exist: {dir}')
+                yield from self.iterate_dir_files(dir, pattern)
+                continue
+
+            # 2 不存在
+            if (not is_http_file(path)) and not os.path.exists(path):
+                raise Exception(f'Step config file or directory not exist: {path}')
+
+            # 3 目录: 遍历子文件
+            if os.path.isdir(path):
+                yield from self.iterate_dir_files(path)
+                continue
+
+            # 4 纯文件
+            yield path
+
+    # 遍历目录中匹配模式的子文件
+    # :param path 目录
+    # :param pattern 文件名模式
+    def iterate_dir_files(self, dir, pattern ='*.yml'):
+        files = os.listdir(dir)
+        files.sort() # 按文件名排序
+        for file in files:
+            if fnmatch.fnmatch(file, pattern): # 匹配文件名模式
+                file = os.path.join(dir, file)
+                if os.path.isfile(file):
+                    yield file
+
+    # 异步执行单个步骤文件
+    # :param step_file 步骤配置文件路径
+    # :param include 是否inlude动作触发
+    async def run_1file_async(self, step_file, include = False):
+        # 加载步骤文件：会更新 self.step_dir 与 self.step_file; 在文件io线程池中加载, 防止读文件时阻塞事件循环
+        steps = await run_in_file_executor(self.load_1file, step_file, include)
+        log.debug(f"Load and run step file: %s", self.step_file)
+
+        # 记录yaml开始
+        self.stat.enter_yaml(step_file)
+
+        # step_dir作为当前目录
+        if self.step_dir_as_cwd:
+            cur_dir = os.getcwd()
+            os.chdir(self.step_dir)
+
+        # 执行多个步骤
+        await self.run_steps_async(steps)
+
+        # 恢复当前目录
+        if self.step_dir_as_cwd:
+            os.chdir(cur_dir)
+
+        # 记录yaml结束
+        self.stat.exit_yaml()
+
+    # 异步执行多个步骤
+    async def run_steps_async(self, steps):
+        # 逐个步骤执行计划
+        stat = self.stat
+        for step in self.get_steps_plan(steps):
+            stat.incr_step()  # 统计
+            if step.error is not None:
+                raise step.error
+            for ap in step.actions:
+                stat.incr_action()  # 统计
+                start = time.perf_counter()
+                try:
+                    await self.run_action_plan_async(ap)
+                finally:
+                    stat.record_action(ap.name or ap.action, time.perf_counter() - start)  # 统计耗时
+
+    # 异步执行单个动作的计划
+    async def run_action_plan_async(self, ap):
+        log.debug(f"handle action: %s=%s", ap.action, ap.param)
+        if ap.error is not None:
+            raise ap.error
+
+        func = self.async_actions.get(ap.name) or self.get_action_func(ap.name)
+        ret = func(ap.param, *ap.args)
+        # 协程函数: 要await
+        if inspect.isawaitable(ret):
+            ret = await ret
+        return ret
+
+    '''
+    异步执行单个动作：就是调用动作名对应的函数
+    :param action 动作名
+    :param param 参数
+    '''
+    async def run_action_async(self, action, param):
+        return await self.run_action_plan_async(self.compile_action(action, param))
+
+    # 异步睡眠
+    async def sleep_async(self, seconds):
+        seconds = replace_var(seconds)  # 替换变量
+        await asyncio.sleep(int(seconds))
+
+    # 异步执行命令
+    async def exec_async(self, cmd):
+        proc = await asyncio.create_subprocess_shell(cmd, stdout=asyncio.subprocess.PIPE)
+        stdout, _ = await proc.communicate()
+        output = stdout.decode()
+        log.debug(f"execute commmand: %s | result: %s", cmd, output)
+
+    # 异步加载并执行其他步骤文件
+    async def include_async(self, step_file):
+        await self.run_1file_async(step_file, True)
+
+    # 异步for循环
+    # :param steps 每个迭代中要执行的步骤
+    # :param n 循环次数/循环列表变量名
+    async def do_for_async(self, steps, n = None):
+        label, iterations = self.parse_for(n)
+        log.debug(f"-- Loop start: %s -- ", label)
+        last_i = get_var('for_i', False) # 旧的索引
+        last_v = get_var('for_v', False) # 旧的元素
+        try:
+            for i, v in iterations:
+                # i+1表示迭代次数比较容易理解
+                log.debug(f"%sth iteration", i+1)
+                set_var('for_i', i+1) # 更新索引
+                set_var('for_v', v) # 更新元素
+                await self.run_steps_async(steps)
+        except BreakException as e:  # 跳出循环
+            log.debug(f"-- Loop break: %s, break condition: %s -- ", label, e.condition)
+        else:
+            log.debug(f"-- Loop finish: %s -- ", label)
+        finally:
+            set_var('for_i', last_i) # 恢复索引
+            set_var('for_v', last_v) # 恢复元素
+
+    # 异步执行一次子步骤，相当于 for(1)
+    async def once_async(self, steps):
+        await self.do_for_async(steps, 1)
+
+    # 异步if条件
+    async def do_if_async(self, steps, expr):
+        val = self.eval_condition(expr)
+        if val:
+            await self.run_steps_async(steps)
+        set_var('doing_else', not val)
+
+    # 异步else条件
+    async def do_else_async(self, steps):
+        if get_var('doing_else'):
+            await self.run_steps_async(steps)
+        set_var('doing_else', None)
+
+    # 异步调用过程
+    async def call_async(self, name):
+        if name not in self.procs:
+            raise Exception("未定义函数")
+
+        # 执行多个步骤
+        steps = self.procs[name]
+        await self.run_steps_async(steps)
+
+# fork出来的子进程要用到的上下文: (boot, 步骤, 父作用域的变量), 用于 for_parallel_process 动作
+fork_context = None
+
+# 在fork出来的子进程中执行单次迭代
+def run_forked_iteration(i, v):
+    boot, steps, parent_vars = fork_context
+    try:
+        return boot.run_iteration(steps, parent_vars, i, v)
+    finally:
+        AsyncLogger.flush() # 子进程可能随时被结束, 先输出本次迭代的日志
+
+# 在子进程中执行单个分片的步骤文件, 用于 run_sharded()
+# :param boot_class boot类
+# :param step_files 步骤文件
+# :param option 父进程的命令选项
+# :return 统计
+def run_shard(boot_class, step_files, option):
+    if option is not None:
+        apply_cmd_option(option)
+    boot = boot_class()
+    boot.stat_dump = False # 由父进程合并统计后再输出
+    try:
+        boot.run(step_files)
+    except Exception as ex:
+        boot.stat.err = str(ex)
+    return boot.stat
@@ -4,6 +4,7 @@ import time
 from io import StringIO
 import yaml
 from dotenv import dotenv_values
+from pyutilb.file import YamlLoader
 from kazoo.client import KazooClient
 from pyutilb.zkfile.filelistener import IFileListener
 from pyutilb.zkfile.zkconfig import ZkConfig
@@ -97,7 +98,7 @@ class ZkConfigFiles(IFileListener):
         if type == "properties":
             return dotenv_values(stream=StringIO(content))  # 加载 properties 文件
         if type == "yaml" or type == "yml":
-            return yaml.load(content, Loader=yaml.FullLoader)  # 加载 yaml 文件
+            return yaml.load(content, Loader=YamlLoader)  # 加载 yaml 文件
         if type == "json":
             return json.loads(content)  # 加载 json 文件
 
@@ -0,0 +1,35 @@
+# 导入耗时的性能测试: 导入pyutilb各模块的耗时, 并校验没有提前导入较重的依赖
+# 运行: python tests/bench_import.py
+import subprocess
+import sys
+import time
+
+N = 5
+
+# 导入后不应加载的较重依赖
+HEAVY_MODULES = ['pandas', 'numpy', 'requests', 'mako', 'jsonpath', 'apscheduler']
+
+# 在新进程中导入模块, 返回(耗时秒数, 已加载的较重依赖)
+def bench(module):
+    code = f"import sys; import {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    cost = time.perf_counter() - start
+    return cost, out.strip()
+
+# 导入n次, 返回耗时的中位数
+def bench_median(module, n = N):
+    results = [bench(module) for _ in range(n)]
+    costs = sorted(cost for cost, _ in results)
+    return costs[n // 2], results[-1][1]
+
+if __name__ == '__main__':
+    base, _ = bench_median('sys')
+    print(f"python startup: {base * 1000:.0f} ms")
+    failed = False
+    for module in ['pyutilb', 'pyutilb.util', 'pyutilb.cmd', 'pyutilb.yaml_boot']:
+        cost, heavy = bench_median(module)
+        print(f"import {module}: {(cost - base) * 1000:.0f} ms" + (f", loaded heavy modules: {heavy}" if heavy else ''))
+        if heavy:
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,50 @@
+# 变量读写的性能测试: get_var()/set_var() 的吞吐量
+# 运行: python tests/bench_vars.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pyutilb.util import get_var, set_var, push_vars_stack, pop_vars_stack
+
+N = 200000
+
+# 测试n次读写, 返回每秒次数
+def bench(n = N):
+    set_var('name', 'shi')
+    start = time.perf_counter()
+    for i in range(n):
+        set_var('i', i)
+        get_var('name')
+    cost = time.perf_counter() - start
+    return n * 2 / cost
+
+# 测试n次变量栈入栈出栈, 返回每秒次数
+def bench_stack(n = N, nvars = 500):
+    for i in range(nvars):
+        set_var(f'var{i}', i)
+    start = time.perf_counter()
+    for i in range(n):
+        push_vars_stack()
+        set_var('var0', i)
+        pop_vars_stack(True)
+    cost = time.perf_counter() - start
+    return n / cost
+
+# 多个协程并发读写, 校验各协程的变量互不干扰
+async def bench_task(i):
+    set_var('task', i)
+    ops = bench(N // 10)
+    await asyncio.sleep(0)
+    assert get_var('task') == i
+    return ops
+
+async def bench_tasks(n_tasks = 10):
+    return await asyncio.gather(*[bench_task(i) for i in range(n_tasks)])
+
+if __name__ == '__main__':
+    print(f"main thread: {bench():,.0f} ops/s")
+    print(f"push/pop with 500 vars: {bench_stack():,.0f} ops/s")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        rates = list(executor.map(lambda _: bench(), range(4)))
+    print(f"4 threads: {sum(rates):,.0f} ops/s")
+    rates = asyncio.run(bench_tasks())
+    print(f"10 asyncio tasks: {sum(rates) / len(rates):,.0f} ops/s per task")
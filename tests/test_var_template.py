@@ -0,0 +1,39 @@
+# 变量表达式的编译渲染 与 逐轮正则替换 的结果要一致
+# 运行: python -m pytest tests/test_var_template.py 或 python tests/test_var_template.py
+from pyutilb.util import set_vars, do_replace_var_by_regex, compile_var_template
+
+# 要对比的表达式, 包含嵌套变量
+exprs = [
+    'hello $name',
+    '${name}-${age}',
+    'a${data.msg}b',
+    'a${data.$k}b',
+    'x${lst.$n}y',
+    '${data.$k}',
+    'x ${random_str($n)} y',
+    'x \\$name y',
+    'x $1 y',
+]
+
+def set_test_vars():
+    set_vars({'name': 'shi', 'age': 1, 'k': 'msg', 'n': 2, 'data': {'msg': 'hi'}, 'lst': [1, 2, 3]})
+
+def test_compiled_equals_regex():
+    set_test_vars()
+    for expr in exprs:
+        expected = do_replace_var_by_regex(expr)
+        actual = compile_var_template(expr).render()
+        if 'random_str' in expr: # 随机值只比较长度
+            assert len(actual) == len(expected), expr
+        else:
+            assert actual == expected, expr
+
+def test_nested_var():
+    set_test_vars()
+    assert compile_var_template('a${data.$k}b').render() == 'ahib'
+    assert compile_var_template('x${lst.$n}y').render() == 'x3y'
+
+if __name__ == '__main__':
+    test_compiled_equals_regex()
+    test_nested_var()
+    print('ok')